@@ -1,4 +1,17 @@
 #!/usr/bin/env python3
 
-from .asdapar2json import ASDAParser
-__all__ = [ASDAParser]
+import sys
+
+__all__ = ["ASDAParser"]
+
+if sys.version_info >= (3, 7):
+    # ASDAParser is imported on first use, so that small entry points like
+    # textconv_client start without loading the parser
+    def __getattr__(name):
+        if name == "ASDAParser":
+            from .asdapar2json import ASDAParser
+            globals()["ASDAParser"] = ASDAParser
+            return ASDAParser
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+else:
+    from .asdapar2json import ASDAParser
@@ -1,7 +1,37 @@
 #!/usr/bin/env python3
+"""Usage: python3 -m asda_tools COMMAND [ARGUMENTS...]
 
+Commands:
+    parse   convert a .par file to JSON (as asdapar2json)
+    build   convert a JSON file back to .par (as json2asdapar)
+    diff    compare .par files with a reference file (as asdapar-diff)
+    set     change parameters of a .par file in place (as asdapar-set)
+
+Run "python3 -m asda_tools COMMAND --help" (or without arguments for parse
+and build) for the options of a command.
+"""
+
+import importlib
 import sys
-from asdapar2json import main
+
+
+# Only the module of the selected command is imported
+COMMANDS = {
+        "parse": "asdapar2json",
+        "build": "json2asdapar",
+        "diff": "asdapardiff",
+        "set": "asdaparset",
+        }
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    if not args or args[0] not in COMMANDS:
+        print(__doc__.strip(), file=sys.stderr)
+        return 2
+    module = importlib.import_module("." + COMMANDS[args[0]], __package__)
+    return module.main(args[1:], prog="python3 -m asda_tools " + args[0])
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""asyncio front end for services which receive or send .par files.
+
+Parsing, verification and reconstruction run in an executor, at most
+max_workers at a time, so the event loop stays responsive while many files
+are processed. Uploads are parsed straight from the stream, without a
+temporary file. All work sent to the executor is done by module-level
+functions on plain data, so a ProcessPoolExecutor can be used as well as
+the default thread pool.
+"""
+
+import asyncio
+import functools
+import os
+
+from .asdapar2json import ASDAParser, ASDAParseError, render_par_to_json
+
+
+def _read_file(filename):
+    with open(filename, "rb") as f:
+        return f.read()
+
+
+def _write_file(filename, binary):
+    with open(filename, "wb") as f:
+        f.write(binary)
+
+
+def _parse(binary, parser_class, opaque_unknown_sections):
+    parser = parser_class(opaque_unknown_sections)
+    parser.load_param_file(binary)
+    parser.parse()
+    parser.reconstruct()
+    parser.assert_reconstruction_correct()
+    return parser.data
+
+
+def _load_json_file(filename, parser_class):
+    parser = parser_class()
+    parser.from_json_file(filename)
+    return parser.data
+
+
+def _reconstruct(data, parser_class):
+    parser = parser_class()
+    parser.data = data
+    parser.reconstruct()
+    return bytes(parser.binary_reconstruct)
+
+
+class AsyncASDAParser(object):
+    """Coroutine versions of the ASDAParser file operations.
+
+    One instance is meant to be shared by all requests of a service; it
+    limits how many files are processed in the executor at once.
+    Parsed files are returned as ASDAParser.data dicts, and reconstructed
+    files as bytes.
+    """
+
+    # Larger streams are refused before they are read into memory; a .par file has about 40 kB
+    MAX_STREAM_SIZE = 16 * 1024 * 1024
+    STREAM_CHUNK_LEN = 64 * 1024
+
+    def __init__(self, max_workers=None, executor=None, parser_class=ASDAParser, opaque_unknown_sections=False):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = executor
+        self.parser_class = parser_class
+        self.opaque_unknown_sections = opaque_unknown_sections
+        # Created on first use, inside the running event loop
+        self._semaphore = None
+
+    async def _run(self, function, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        async with self._semaphore:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def read_stream(self, stream):
+        """Read a whole binary stream into memory and return it as bytes.
+
+        The stream is either an asyncio.StreamReader (or anything with a
+        coroutine read(n), like an upload body) or an async iterable of
+        bytes chunks.
+        """
+        content = bytearray()
+        if hasattr(stream, "read"):
+            while True:
+                chunk = await stream.read(self.STREAM_CHUNK_LEN)
+                if not chunk:
+                    break
+                self._append_chunk(content, chunk)
+        else:
+            async for chunk in stream:
+                self._append_chunk(content, chunk)
+        return bytes(content)
+
+    def _append_chunk(self, content, chunk):
+        if len(content) + len(chunk) > self.MAX_STREAM_SIZE:
+            raise ASDAParseError("Stream is larger than {} bytes".format(self.MAX_STREAM_SIZE))
+        content += chunk
+
+    async def _read_source(self, source):
+        if isinstance(source, str) or hasattr(source, "__fspath__"):
+            return await self._run(_read_file, source)
+        if isinstance(source, memoryview):
+            # Buffers are sent to the executor, which may be a process pool
+            return source.tobytes()
+        if isinstance(source, (bytes, bytearray)):
+            return source
+        return await self.read_stream(source)
+
+    async def load_param_file(self, source):
+        """Parse and verify .par content from a path, a buffer or a stream (see read_stream()).
+
+        Returns ASDAParser.data.
+        """
+        binary = await self._read_source(source)
+        return await self._run(_parse, binary, self.parser_class, self.opaque_unknown_sections)
+
+    async def render_json(self, source):
+        """Return the verified JSON text (with a trailing newline), as asdapar2json prints it."""
+        binary = await self._read_source(source)
+        return await self._run(render_par_to_json, binary,
+                opaque_unknown_sections=self.opaque_unknown_sections, parser_class=self.parser_class)
+
+    async def from_json_file(self, filename):
+        """Load ASDAParser.data from a JSON file."""
+        return await self._run(_load_json_file, filename, self.parser_class)
+
+    async def reconstruct(self, data):
+        """Return the binary .par file for ASDAParser.data."""
+        return await self._run(_reconstruct, data, self.parser_class)
+
+    async def write_reconstruction(self, data, target):
+        """Reconstruct data and write it to a path or an asyncio.StreamWriter (anything with write() and drain())."""
+        binary = await self.reconstruct(data)
+        if isinstance(target, str) or hasattr(target, "__fspath__"):
+            await self._run(_write_file, target, binary)
+        else:
+            target.write(binary)
+            await target.drain()
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 
+import array
+import binascii
+import functools
+import importlib.util
+import itertools
+import mmap
+import os
 import sys
 import struct
-import json
-import re
+import time
 
 
 class ASDAParseError(Exception):
@@ -13,17 +19,89 @@ class ASDAReconstructError(Exception):
     pass
 
 
+def param_key(block_id, param_id):
+    return "P{}-{:02d}".format(block_id, param_id)
+
+
+def parse_param_key(key):
+    """Inverse of param_key(): "P1-44" -> (1, 44)."""
+    block_id, _, param_id = key[1:].partition("-")
+    return int(block_id), int(param_id)
+
+
+class ParamTable(object):
+    """Parameter ids in sorted order, shared by the 0x0018 and 0x0006 sections.
+
+    Keeps (block_id, param_id) as integers next to the "P{}-{:02d}" keys of
+    ASDAParser.data["params"], so they do not need to be recovered from the
+    key names and sorted again for every section and every reconstruct().
+    """
+
+    __slots__ = ("block_ids", "param_ids", "keys", "key_set")
+
+    def __init__(self, entries):
+        entries = sorted(entries)
+        self.block_ids = array.array("H", [block_id for block_id, param_id, key in entries])
+        self.param_ids = array.array("H", [param_id for block_id, param_id, key in entries])
+        self.keys = [key for block_id, param_id, key in entries]
+        self.key_set = frozenset(self.keys)
+
+    @classmethod
+    def from_keys(cls, keys):
+        entries = []
+        for key in keys:
+            block_id, param_id = parse_param_key(key)
+            entries.append((block_id, param_id, key))
+        return cls(entries)
+
+    def matches(self, params):
+        return self.key_set == params.keys()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return zip(self.block_ids, self.param_ids, self.keys)
+
+
+class SectionCodec(object):
+    """Decoder and encoder of one section type.
+
+    Holds the names of the parser methods _load_section_<name>,
+    _section_<name>_size and _reconstruct_section_<name>_into, and of the
+    optional _section_<name>_records(body_offset), which returns the number
+    of records just loaded for the stats hooks. They are looked up on the
+    parser instance, so subclasses (e.g. the NumPy backend) can override a
+    method without registering the section again.
+    """
+
+    __slots__ = ("name", "load", "size", "write_into", "records")
+
+    def __init__(self, name):
+        self.name = name
+        self.load = "_load_section_" + name
+        self.size = "_section_" + name + "_size"
+        self.write_into = "_reconstruct_section_" + name + "_into"
+        self.records = "_section_" + name + "_records"
+
+
+def _buffers_equal(left, right):
+    # bytes and bytearray compare with memcmp, memoryview goes element by element
+    if not isinstance(left, (bytes, bytearray)):
+        left, right = right, left
+    if not isinstance(left, (bytes, bytearray)):
+        left = bytes(left)
+    return left == right
+
+
 class ASDAParser(object):
-    # TODO begin obsolete
-    #BINARY_LEN = 39248
-    BINARY_LEN = 39248 + (8 + 48) * 2
-    VERSION_OFFSET = 0x10
-    #PARAM_BLOCK_LENGTHS =  [64, 99, 95, 14, 25, 100, 100, 28]
-    PARAM_BLOCK_LENGTHS =  [64, 99, 95 + 2, 14, 25, 100, 100, 28]
-    PARAM_OFFSET = 0x1f0
-    MAX_MIN_DEFAULT_OFFSET = 0x1270
-    TRAILER_OFFSET = 0x7550
-    # TODO end obsolete
+    """Parser and writer of .par files.
+
+    The layout constants and SECTION_CODECS describe files of ASDA-A2 drives.
+    Other series or firmware versions can be supported by a subclass which
+    overrides the constants and registers its own sections, see
+    register_section().
+    """
 
     BINARY_CONSTANTS = {
             # XXX We have no idea, what it means
@@ -45,30 +123,189 @@ class ASDAParser(object):
                                        [0x00] * 16,
             }
     ASDASOFT_VERSION_STRING_LEN = 0x70
+    BINARY_CONSTANT_BYTES = {name: bytes(value) for name, value in BINARY_CONSTANTS.items()}
+    SECTION_HEADER_LEN = 16
+    VERIFY_CHUNK_LEN = 4096
+    JSON_WRITE_CHUNKS = 4096
+    NULL_BLOCK_COUNT = 0x40
+    # Increase whenever the JSON output for the same input changes
+    PARSER_VERSION = 1
+
+    # block_id, param_id at the start of both parameter records
+    PARAM_ID_RECORD = struct.Struct("<HH")
+    # block_id, param_id, current value
+    CURRENT_PARAM_RECORD = struct.Struct("<HHL")
+    # block_id, param_id, max, min and default (each as two 16-bit words), unit, padding
+    MAX_MIN_DEFAULT_UNIT_RECORD = struct.Struct("<HH6HH{}s".format(len(BINARY_CONSTANTS["0006_unit_param_unknown"])))
+    MAX_MIN_DEFAULT_UNIT_END_RECORD = bytes(16)
+    UNIT_PARAM_PADDING = bytes(BINARY_CONSTANTS["0006_unit_param_unknown"])
+
+    # Keys are section types, or (section_type, firmware_version) for a
+    # variant used only by one firmware version. Variants are looked up
+    # first, so the 0x0001 section has to come before them.
+    SECTION_CODECS = {
+            0x0001: SectionCodec("0001_firmware_version"),
+            0x0002: SectionCodec("0002_unknown"),
+            0x0018: SectionCodec("0018_current_params"),
+            0x0006: SectionCodec("0006_max_min_default_unit_params"),
+            0x0007: SectionCodec("0007_null_block"),
+            0x0008: SectionCodec("0008_numbered_null_blocks"),
+            }
 
-    def __init__(self):
+    def __init__(self, opaque_unknown_sections=False):
+        """With opaque_unknown_sections, sections of unknown type do not stop
+        parse(). Their content is kept as a hex string in "opaque_content" of
+        the section table row, and written back unchanged by reconstruct().
+        """
+        self.opaque_unknown_sections = opaque_unknown_sections
         self.binary = None
         self.binary_reconstruct = None
         self.data = None
+        self.param_table = None
+        self.stats_hooks = []
+
+    def add_stats_hook(self, hook):
+        """Register hook(record), called after every processing stage.
+
+        The record is a dict with "stage" (e.g. "load", "magic", "section_table",
+        "section_0x0018", "json_encode", "reconstruct", "verify"), "seconds"
+        and "bytes", and "records" for stages which decode records.
+        """
+        self.stats_hooks.append(hook)
+
+    @classmethod
+    def register_section(cls, section_type, codec, firmware_version=None):
+        """Add or replace the codec of a section type for this class and its subclasses."""
+        if "SECTION_CODECS" not in cls.__dict__:
+            cls.SECTION_CODECS = dict(cls.SECTION_CODECS)
+        key = section_type if firmware_version is None else (section_type, firmware_version)
+        cls.SECTION_CODECS[key] = codec
+
+    def _section_codec(self, section_type):
+        codec = self.SECTION_CODECS.get((section_type, self.data.get("firmware_version")))
+        if codec is None:
+            codec = self.SECTION_CODECS.get(section_type)
+        return codec
+
+    def _report_stats(self, stage, start, size, records=None):
+        if not self.stats_hooks:
+            return
+        record = {"stage": stage, "seconds": time.perf_counter() - start, "bytes": size}
+        if records is not None:
+            record["records"] = records
+        for hook in self.stats_hooks:
+            hook(record)
+
+    def load_param_file(self, source):
+        """Load .par data from a path, an open binary file or a buffer.
+
+        Buffers (bytes, bytearray, memoryview, mmap) are used in place
+        without copying; paths and file objects are read in one go. Call
+        close() (or use the parser as a context manager) before closing an
+        mmap, which cannot be closed while the parser still refers to it.
+        """
+        start = time.perf_counter()
+        if isinstance(source, str) or hasattr(source, "__fspath__"):
+            with open(source, "rb") as f:
+                source = f.read()
+        elif hasattr(source, "read") and not isinstance(source, mmap.mmap):
+            source = source.read()
+        self.binary = memoryview(source).cast("B")
+        self._report_stats("load", start, len(self.binary))
+
+    def close(self):
+        """Release the loaded buffer; the parsed data stays available."""
+        if self.binary is not None:
+            self.binary.release()
+            self.binary = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_reconstruction(self, target):
+        """Write the reconstructed file to a path, a file descriptor or a binary file object."""
+        if isinstance(target, int):
+            view = memoryview(self.binary_reconstruct)
+            while view:
+                view = view[os.write(target, view):]
+        elif hasattr(target, "write"):
+            target.write(self.binary_reconstruct)
+        else:
+            with open(target, "wb") as f:
+                f.write(self.binary_reconstruct)
 
-    def load_param_file(self, filename):
-        with open(filename, "rb") as f:
-            byte = f.read()
-            self.binary = b''
-            while byte:
-                self.binary += byte
-                byte = f.read(1)
-
-    def write_reconstruction(self, filename):
-        with open(filename, "wb") as f:
-            byte = f.write(self.binary_reconstruct)
+    def assert_reconstruction_correct(self, diff_report=False):
+        """Check that the reconstruction is identical to the loaded file.
 
-    def assert_reconstruction_correct(self):
+        With diff_report, the raised error lists every differing range
+        instead of just the first differing byte.
+        """
+        start = time.perf_counter()
         if len(self.binary) != len(self.binary_reconstruct):
             raise ASDAParseError("Reconstruction is different: wrong length: expected {}, got {}".format(len(self.binary), len(self.binary_reconstruct)))
-        for position, (orig, our) in enumerate(zip(self.binary, self.binary_reconstruct)):
-            if orig != our:
-                raise ASDAParseError("Reconstruction is different at position 0x{:04X}: expected byte 0x{:02X}, recreated 0x{:02X}".format(position, orig, our))
+        if _buffers_equal(self.binary, self.binary_reconstruct):
+            self._report_stats("verify", start, len(self.binary))
+            return
+        if diff_report:
+            raise ASDAParseError("Reconstruction is different:\n" + "\n".join(
+                "0x{:04X}-0x{:04X} ({} bytes): {}".format(start, end - 1, end - start, description)
+                for start, end, description in self.reconstruction_differences()))
+        position = next(self._iter_different_positions())
+        raise ASDAParseError("Reconstruction is different at position 0x{:04X}: expected byte 0x{:02X}, recreated 0x{:02X}".format(position, self.binary[position], self.binary_reconstruct[position]))
+
+    def _iter_different_positions(self):
+        original = memoryview(self.binary)
+        reconstruct = memoryview(self.binary_reconstruct)
+        length = min(len(original), len(reconstruct))
+        for chunk_start in range(0, length, self.VERIFY_CHUNK_LEN):
+            chunk_end = min(chunk_start + self.VERIFY_CHUNK_LEN, length)
+            if _buffers_equal(original[chunk_start : chunk_end], reconstruct[chunk_start : chunk_end]):
+                continue
+            for position in range(chunk_start, chunk_end):
+                if original[position] != reconstruct[position]:
+                    yield position
+
+    def reconstruction_differences(self):
+        """Return a list of (start, end, description) of all differing byte ranges.
+
+        The description names the header, section and parameter (if any)
+        at the start of each range.
+        """
+        ranges = []
+        for position in self._iter_different_positions():
+            if ranges and ranges[-1][1] == position:
+                ranges[-1][1] = position + 1
+            else:
+                ranges.append([position, position + 1])
+        return [(start, end, self._describe_offset(start)) for start, end in ranges]
+
+    def _describe_offset(self, offset):
+        if not self.data or "section_table" not in self.data:
+            return "unknown"
+        for section_number, section in enumerate(self.data["section_table"]):
+            section_start = section["section_offset"]
+            if not section_start <= offset < section_start + section.get("section_length", 0):
+                continue
+            description = "section #{} (section type 0x{:04X})".format(section_number, section["section_type"])
+            content_start = section_start + self.SECTION_HEADER_LEN
+            if offset < content_start:
+                return description + ", header"
+            record_size = {
+                    0x0018: self.CURRENT_PARAM_RECORD.size,
+                    0x0006: self.MAX_MIN_DEFAULT_UNIT_RECORD.size,
+                    }.get(section["section_type"])
+            if record_size:
+                record_start = content_start + (offset - content_start) // record_size * record_size
+                block_id, param_id = self.PARAM_ID_RECORD.unpack_from(self.binary, record_start)
+                if block_id or param_id:
+                    description += ", parameter " + param_key(block_id, param_id)
+            return description
+        if offset < min([section["section_offset"] for section in self.data["section_table"]] or [0]):
+            return "file header"
+        return "outside of all sections"
 
     def swap_words(self, param):
         byte_str = struct.pack("<L", param)
@@ -76,8 +313,15 @@ class ASDAParser(object):
         return struct.unpack("<L", swapped)[0]
 
     def _check_equal(self, constant_name):
-        constant = self.BINARY_CONSTANTS[constant_name]
-        self._check_equal_array(constant)
+        self._check_equal_bytes(self.BINARY_CONSTANT_BYTES[constant_name])
+
+    def _check_equal_bytes(self, expected):
+        end = self.current_offset + len(expected)
+        if _buffers_equal(expected, self.binary[self.current_offset : end]):
+            self.current_offset = end
+        else:
+            # Again byte by byte, to report the first wrong byte
+            self._check_equal_array(expected)
 
     def _check_equal_array(self, array):
         for expected_byte in array:
@@ -86,21 +330,21 @@ class ASDAParser(object):
             self.current_offset += 1
 
     def _load_storage_mode(self):
-        value, = struct.unpack("<L", self.binary[self.current_offset : self.current_offset + 4])
+        value, = struct.unpack_from("<L", self.binary, self.current_offset)
         self.data["storage_mode"] = value
         if value not in [0x01, 0x03]:
             raise ASDAParseError("Unknown storage mode at position 0x{:04X}, got 0x{:04X}".format(self.current_offset, value))
         self.current_offset += 4
 
     def _load_asdasoft_version_string(self):
-        encoded_version_string = self.binary[self.current_offset: self.current_offset + self.ASDASOFT_VERSION_STRING_LEN].split(b'\x00')[0]
+        encoded_version_string = bytes(self.binary[self.current_offset: self.current_offset + self.ASDASOFT_VERSION_STRING_LEN]).split(b'\x00')[0]
         self.data["asdasoft_version_string"] = encoded_version_string.decode()
         self._check_equal_array(self._reconstruct_asdasoft_version_string_to_array())
 
     def _section_table_load_row(self):
-        row_type, position = struct.unpack("<HL", self.binary[self.current_offset : self.current_offset + 6])
+        row_type, position = struct.unpack_from("<HL", self.binary, self.current_offset)
         self.current_offset += 6
-        self._check_equal_array([0x00] * 10)
+        self._check_equal_bytes(bytes(10))
         self.data["section_table"].append({
             "section_type": row_type,
             "section_offset": position})
@@ -115,32 +359,38 @@ class ASDAParser(object):
 
     def _load_sections(self):
         for section_number, section in enumerate(self.data["section_table"]):
+            start = time.perf_counter()
             expected_end = self._load_and_check_section_header(section_number, section)
+            body_offset = self.current_offset
+            self._load_one_section(section_number, section, expected_end)
+            if self.stats_hooks:
+                self._report_stats("section_0x{:04X}".format(section["section_type"]), start, section["section_length"],
+                        self._section_records(section["section_type"], body_offset))
+
+    def _section_records(self, section_type, body_offset):
+        codec = self._section_codec(section_type)
+        records = getattr(self, codec.records, None) if codec is not None else None
+        return records(body_offset) if records is not None else None
+
+    def _load_one_section(self, section_number, section, expected_end):
+        codec = self._section_codec(section["section_type"])
+        if codec is not None:
+            getattr(self, codec.load)(expected_end)
+        elif self.opaque_unknown_sections:
+            section["opaque_content"] = binascii.hexlify(self.binary[self.current_offset : expected_end]).decode("ascii")
+            self.current_offset = expected_end
+        else:
+            raise ASDAParseError("Problem parsing section #{}: Unknown section type: 0x{:04X}".format(section_number, section["section_type"]))
 
-            if section["section_type"] == 0x0001:
-                self._load_section_0001_firmware_version(expected_end)
-            elif section["section_type"] == 0x0002:
-                self._load_section_0002_unknown(expected_end)
-            elif section["section_type"] == 0x0018:
-                self._load_section_0018_current_params(expected_end)
-            elif section["section_type"] == 0x0006:
-                self._load_section_0006_max_min_default_unit_params(expected_end)
-            elif section["section_type"] == 0x0007:
-                self._load_section_0007_null_block(expected_end)
-            elif section["section_type"] == 0x0008:
-                self._load_section_0008_numbered_null_blocks(expected_end)
-            else:
-                raise ASDAParseError("Problem parsing section #{}: Unknown section type: 0x{:04X}".format(section_number, section["section_type"]))
-
-            if self.current_offset != expected_end:
-                raise ASDAParseError("Problem parsing section #{} (section type: 0x{:04X}): expected end = 0x{:04X}, but we finished parsing at position 0x{:04X}".format(section_number, section["section_type"], expected_end, self.current_offset))
+        if self.current_offset != expected_end:
+            raise ASDAParseError("Problem parsing section #{} (section type: 0x{:04X}): expected end = 0x{:04X}, but we finished parsing at position 0x{:04X}".format(section_number, section["section_type"], expected_end, self.current_offset))
 
     def _load_and_check_section_header(self, section_number, section):
         if section["section_offset"] != self.current_offset:
             raise ASDAParseError("Problem before parsing section #{} (section type: 0x{:04X}): it should start at offset 0x{:04X} (according to the section table), but we are at position 0x{:04X}".format(section_number, section["section_type"], section["section_offset"], self.current_offset))
-        section_type, section_length = struct.unpack("<HL", self.binary[self.current_offset : self.current_offset + 6])
+        section_type, section_length = struct.unpack_from("<HL", self.binary, self.current_offset)
         self.current_offset += 6
-        self._check_equal_array([0x00] * 10)
+        self._check_equal_bytes(bytes(10))
 
         if section["section_type"] != section_type:
             raise ASDAParseError("Problem parsing header of section #{}: expected section type: 0x{:04X} (according to the table), but we found type: 0x{:04X} (section offset: 0x{:04X}".format(section_number, section["section_type"], section_type, section["section_offset"]))
@@ -151,14 +401,14 @@ class ASDAParser(object):
 
     def _load_section_0001_firmware_version(self, expected_end):
         self._check_equal("0001_firmware_version_1")
-        fw_1, fw_2 = struct.unpack("<LL", self.binary[self.current_offset : self.current_offset + 8])
+        fw_1, fw_2 = struct.unpack_from("<LL", self.binary, self.current_offset)
         self.current_offset += 8
 
         self._check_equal("0001_firmware_version_2")
-        sub_fw_1, sub_fw_2 = struct.unpack("<LL", self.binary[self.current_offset : self.current_offset + 8])
+        sub_fw_1, sub_fw_2 = struct.unpack_from("<LL", self.binary, self.current_offset)
         self.current_offset += 8
 
-        self._check_equal_array([0x00] * 100)
+        self._check_equal_bytes(bytes(100))
 
         if fw_1 != fw_2:
             raise ASDAParseError("Different firmware version in the header 0x{:04X} != 0x{:04X}".format(fw_1, fw_2))
@@ -171,70 +421,78 @@ class ASDAParser(object):
 
     def _load_section_0002_unknown(self, expected_end):
         self._check_equal("0002_unknown_1")
-        unknown_1, = struct.unpack("<H", self.binary[self.current_offset : self.current_offset + 2])
+        unknown_1, = struct.unpack_from("<H", self.binary, self.current_offset)
         self.current_offset += 2
         self.data["0002_unknown_x"] = unknown_1
         self._check_equal("0002_unknown_2")
 
-    def _load_one_current_param(self):
-        block_id, param_id, value, = struct.unpack("<HHL", self.binary[self.current_offset : self.current_offset + 8])
-        self.current_offset += 8
-        is_end = block_id == 0 and param_id == 0 and value == 0
-        return is_end, block_id, param_id, value
-
     def _load_section_0018_current_params(self, expected_end):
         self.data["params"] = {}
-        is_end, block_id, param_id, value = self._load_one_current_param()
-        while not is_end:
-            key_name = "P{}-{:02d}".format(block_id, param_id)
-            self.data["params"][key_name] = {
+        params = self.data["params"]
+        record = self.CURRENT_PARAM_RECORD
+        start = self.current_offset
+        end = start + (len(self.binary) - start) // record.size * record.size
+        entries = []
+        for index, (block_id, param_id, value) in enumerate(record.iter_unpack(self.binary[start:end])):
+            if block_id == 0 and param_id == 0 and value == 0:
+                self.current_offset = start + (index + 1) * record.size
+                self.param_table = ParamTable(entries)
+                return
+            key = param_key(block_id, param_id)
+            if key not in params:
+                entries.append((block_id, param_id, key))
+            params[key] = {
                     "current": value
                     }
-            is_end, block_id, param_id, value = self._load_one_current_param()
-
-    def _load_one_max_min_default_unit_param(self):
-        block_id, param_id, max_value, min_value, default_value, = struct.unpack("<HHLLL", self.binary[self.current_offset : self.current_offset + 16])
-        self.current_offset += 16
-        max_value = self.swap_words(max_value)
-        min_value = self.swap_words(min_value)
-        default_value = self.swap_words(default_value)
-        unit = 0
+        # No terminating record before the end of file
+        self.current_offset = end
+        record.unpack_from(self.binary, self.current_offset)
 
-        is_end = block_id == 0 and param_id == 0 and max_value == 0 and min_value == 0 and default_value == 0
-        if is_end:
-            return is_end, block_id, param_id, max_value, min_value, default_value, unit
-
-        unit, = struct.unpack("<H", self.binary[self.current_offset : self.current_offset + 2])
-        self.current_offset += 2
-        self._check_equal("0006_unit_param_unknown")
-        return is_end, block_id, param_id, max_value, min_value, default_value, unit
+    def _section_0018_current_params_records(self, body_offset):
+        # Without the terminating record
+        return (self.current_offset - body_offset) // self.CURRENT_PARAM_RECORD.size - 1
 
     def _load_section_0006_max_min_default_unit_params(self, expected_end):
-        is_end, block_id, param_id, max_value, min_value, default_value, unit = self._load_one_max_min_default_unit_param()
-        while not is_end:
-            key_name = "P{}-{:02d}".format(block_id, param_id)
-            self.data["params"][key_name]["max"] = max_value
-            self.data["params"][key_name]["min"] = min_value
-            self.data["params"][key_name]["default"] = default_value
-            self.data["params"][key_name]["unit"] = unit
-
-            is_end, block_id, param_id, max_value, min_value, default_value, unit = self._load_one_max_min_default_unit_param()
+        params = self.data["params"]
+        record = self.MAX_MIN_DEFAULT_UNIT_RECORD
+        end_record = self.MAX_MIN_DEFAULT_UNIT_END_RECORD
+        unit_padding = self.UNIT_PARAM_PADDING
+        binary = self.binary
+        offset = self.current_offset
+        while binary[offset : offset + len(end_record)] != end_record:
+            (block_id, param_id, max_low, max_high, min_low, min_high,
+                    default_low, default_high, unit, padding) = record.unpack_from(binary, offset)
+            if padding != unit_padding:
+                self.current_offset = offset + record.size - len(unit_padding)
+                self._check_equal("0006_unit_param_unknown")
+            param = params[param_key(block_id, param_id)]
+            # Values are stored with swapped 16-bit words, see swap_words()
+            param["max"] = max_low << 16 | max_high
+            param["min"] = min_low << 16 | min_high
+            param["default"] = default_low << 16 | default_high
+            param["unit"] = unit
+            offset += record.size
+        self.current_offset = offset + len(end_record)
+
+    def _section_0006_max_min_default_unit_params_records(self, body_offset):
+        return (self.current_offset - len(self.MAX_MIN_DEFAULT_UNIT_END_RECORD) - body_offset) // self.MAX_MIN_DEFAULT_UNIT_RECORD.size
 
     def _load_section_0007_null_block(self, expected_end):
-        self._check_equal_array([0x00] * 0x30)
+        self._check_equal_bytes(bytes(0x30))
 
     def _load_section_0008_numbered_null_blocks(self, expected_end):
-        null_block_count, = struct.unpack("<H", self.binary[self.current_offset : self.current_offset + 2])
+        null_block_count, = struct.unpack_from("<H", self.binary, self.current_offset)
         self.current_offset += 2
-        self._check_equal_array([0x00] * 14)
+        self._check_equal_bytes(bytes(14))
         if null_block_count != 0x40:
             raise ASDAParseError("Section type 0x008: unexpected null_block_count {}".format(null_block_count))
+        null_block_padding = bytes(14 + 0x80)
         for null_id in range(null_block_count):
-            real_null_block_id, = struct.unpack("<H", self.binary[self.current_offset : self.current_offset + 2])
+            real_null_block_id, = struct.unpack_from("<H", self.binary, self.current_offset)
             self.current_offset += 2
             if null_id != real_null_block_id:
                 raise ASDAParseError("Section type 0x008: unexpected null_block_id {}, expected {}".format(real_null_block_id, null_id))
-            self._check_equal_array([0x00] * (14 + 0x80))
+            self._check_equal_bytes(null_block_padding)
 
     def _check_eof(self):
         if self.current_offset != len(self.binary):
@@ -242,26 +500,25 @@ class ASDAParser(object):
 
     def parse(self):
         self.data = {}
+        self.param_table = None
         self.current_offset = 0
+        start = time.perf_counter()
         self._check_equal("magic")
         self._load_storage_mode()
         self._load_asdasoft_version_string()
         self._check_equal("before_table")
+        self._report_stats("magic", start, self.current_offset)
+
+        start, table_start = time.perf_counter(), self.current_offset
         self._load_section_table()
+        self._report_stats("section_table", start, self.current_offset - table_start, len(self.data["section_table"]))
         self._load_sections()
         self._check_eof()
 
-    def _reconstruct_block_array(self, array):
-        self.binary_reconstruct += bytes(array)
-
-    def _reconstruct_block(self, constant_name):
-        self._reconstruct_block_array(self.BINARY_CONSTANTS[constant_name])
-
-    def _reconstruct_block_to_array(self, constant_name):
-        return bytes(self.BINARY_CONSTANTS[constant_name])
-
-    def _reconstruct_storage_mode(self):
-        self.binary_reconstruct += struct.pack("<L", self.data["storage_mode"])
+    def _reconstruct_block_into(self, buffer, offset, constant_name):
+        constant = self.BINARY_CONSTANT_BYTES[constant_name]
+        buffer[offset : offset + len(constant)] = constant
+        return offset + len(constant)
 
     def _reconstruct_asdasoft_version_string_to_array(self):
         reconstructed_encoded_version_string = self.data["asdasoft_version_string"].encode()
@@ -270,139 +527,363 @@ class ASDAParser(object):
         reconstructed_string_binary[:version_length] = reconstructed_encoded_version_string
         return reconstructed_string_binary
 
-    def _reconstruct_asdasoft_version_string(self):
-        self.binary_reconstruct += self._reconstruct_asdasoft_version_string_to_array()
-
-    def _reconstruct_section_table(self):
-        for row in self.data["section_table"]:
-            self.binary_reconstruct += struct.pack("<HL", row["section_type"], row["section_offset"])
-            self._reconstruct_block_array([0x00] * 10)
-
-    def _reconstruct_section_header_to_array(self, section_type, section_content_length):
-        section_length = section_content_length + 16
-        return struct.pack("<HL", section_type, section_length) + bytes([0x00] * 10)
-
-    def _reconstruct_one_section_to_array(self, section_type):
-        section_content_array = b''
-        if section_type == 0x0001:
-            section_content_array = self._reconstruct_section_0001_firmware_version_to_array()
-        elif section_type == 0x0002:
-            section_content_array = self._reconstruct_section_0002_unknown_to_array()
-        elif section_type == 0x0018:
-            section_content_array = self._reconstruct_section_0018_current_params_to_array()
-        elif section_type == 0x0006:
-            section_content_array = self._reconstruct_section_0006_max_min_default_unit_params_to_array()
-        elif section_type == 0x0007:
-            section_content_array = self._reconstruct_section_0007_null_block_to_array()
-        elif section_type == 0x0008:
-            section_content_array = self._reconstruct_section_0008_numbered_null_blocks_to_array()
-        else:
-            raise ASDAReconstructError("Cannot reconstruct unknown type 0x{:04X}".format(section_type))
-        return self._reconstruct_section_header_to_array(section_type, len(section_content_array)) + section_content_array
-
-    def _reconstruct_sections(self):
+    def _section_encoder(self, section):
+        """Return (content_size, write_content_into) methods for a section table row."""
+        if "opaque_content" in section:
+            content = bytes.fromhex(section["opaque_content"])
+
+            def write_content_into(buffer, offset):
+                buffer[offset : offset + len(content)] = content
+            return (lambda: len(content)), write_content_into
+        codec = self._section_codec(section["section_type"])
+        if codec is None:
+            raise ASDAReconstructError("Cannot reconstruct unknown type 0x{:04X}".format(section["section_type"]))
+        return getattr(self, codec.size), getattr(self, codec.write_into)
+
+    def _header_size(self, version_string):
+        return (len(self.BINARY_CONSTANT_BYTES["magic"]) + 4 + len(version_string) +
+                len(self.BINARY_CONSTANT_BYTES["before_table"]) + self.SECTION_HEADER_LEN * len(self.data["section_table"]))
+
+    def update_section_table(self):
+        """Recompute offsets and lengths in the section table to match self.data.
+
+        Needed before reconstruct() when parameters were added or removed.
+        """
+        offset = self._header_size(self._reconstruct_asdasoft_version_string_to_array())
+        for section in self.data["section_table"]:
+            content_size, write_content_into = self._section_encoder(section)
+            section["section_offset"] = offset
+            section["section_length"] = self.SECTION_HEADER_LEN + content_size()
+            offset += section["section_length"]
+
+    def _reconstruct_layout(self, version_string):
+        """Check the section table against the data.
+
+        Returns the total file size and a list of (section_type, offset,
+        length, write_content_into) for all sections.
+        """
+        offset = self._header_size(version_string)
+        layout = []
         for section_number, section in enumerate(self.data["section_table"]):
-            if section["section_offset"] != len(self.binary_reconstruct):
-                raise ASDAReconstructError("Offset error: we want to write section #{} (section type 0x{:04X}) at offset 0x{:04X}, but offset 0x{:04X} is specified in the section table".format(section_number, section["section_type"], len(self.binary_reconstruct), section["section_offset"]))
-
-            section_array = self._reconstruct_one_section_to_array(section["section_type"])
-            if section["section_length"] != len(section_array):
-                raise ASDAReconstructError("Length error: we want to write section #{} (section type 0x{:04X}) with length 0x{:04X}, but length 0x{:04X} is specified in the section table".format(section_number, section["section_type"], len(section_array), section["section_length"]))
-            self.binary_reconstruct += section_array
-
-    def _reconstruct_section_0001_firmware_version_to_array(self):
-        ret = self._reconstruct_block_to_array("0001_firmware_version_1")
-        ret += struct.pack("<LL", self.data["firmware_version"], self.data["firmware_version"])
-        ret += self._reconstruct_block_to_array("0001_firmware_version_2")
-        ret += struct.pack("<LL", self.data["firmware_subversion"], self.data["firmware_subversion"])
-        ret += bytes([0x00] * 100)
-        return ret
-
-    def _reconstruct_section_0002_unknown_to_array(self):
-        ret = self._reconstruct_block_to_array("0002_unknown_1")
-        ret += struct.pack("<H", self.data["0002_unknown_x"])
-        ret += self._reconstruct_block_to_array("0002_unknown_2")
-        return ret
-
-    def _reconstruct_section_0018_current_params_to_array(self):
-        ret = b''
-        for key in sorted(self.data["params"].keys()):
-            number_strings = re.findall(r'\d+', key)
-            block_id, param_id = map(int, number_strings)
-            ret += struct.pack("<HHL", block_id, param_id, self.data["params"][key]["current"])
-        ret += struct.pack("<HHL", 0, 0, 0)
-        return ret
-
-    def _reconstruct_section_0006_max_min_default_unit_params_to_array(self):
-        ret = b''
-        for key in sorted(self.data["params"].keys()):
-            number_strings = re.findall(r'\d+', key)
-            block_id, param_id = map(int, number_strings)
-            ret += struct.pack("<HHLLL", block_id, param_id,
-                    self.swap_words(self.data["params"][key]["max"]),
-                    self.swap_words(self.data["params"][key]["min"]),
-                    self.swap_words(self.data["params"][key]["default"])
-                    )
-            ret += struct.pack("<H", self.data["params"][key]["unit"])
-            ret += self._reconstruct_block_to_array("0006_unit_param_unknown")
-        ret += struct.pack("<HHLLL", 0, 0, 0, 0, 0)
-        return ret
-
-    def _reconstruct_section_0007_null_block_to_array(self):
-        return bytes([0x00] * 0x30)
-
-    def _reconstruct_section_0008_numbered_null_blocks_to_array(self):
-        null_block_count = 0x40
-        ret = struct.pack("<H", null_block_count)
-        ret += bytes([0x00] * 14)
-
-        for null_id in range(null_block_count):
-            ret += struct.pack("<H", null_id)
-            ret += bytes([0x00] * (14 + 0x80))
-        return ret
+            if section["section_offset"] != offset:
+                raise ASDAReconstructError("Offset error: we want to write section #{} (section type 0x{:04X}) at offset 0x{:04X}, but offset 0x{:04X} is specified in the section table".format(section_number, section["section_type"], offset, section["section_offset"]))
+
+            content_size, write_content_into = self._section_encoder(section)
+            section_length = self.SECTION_HEADER_LEN + content_size()
+            if section["section_length"] != section_length:
+                raise ASDAReconstructError("Length error: we want to write section #{} (section type 0x{:04X}) with length 0x{:04X}, but length 0x{:04X} is specified in the section table".format(section_number, section["section_type"], section_length, section["section_length"]))
+            layout.append((section["section_type"], offset, section_length, write_content_into))
+            offset += section_length
+        return offset, layout
+
+    def _section_0001_firmware_version_size(self):
+        return len(self.BINARY_CONSTANT_BYTES["0001_firmware_version_1"]) + 8 + len(self.BINARY_CONSTANT_BYTES["0001_firmware_version_2"]) + 8 + 100
+
+    def _reconstruct_section_0001_firmware_version_into(self, buffer, offset):
+        offset = self._reconstruct_block_into(buffer, offset, "0001_firmware_version_1")
+        struct.pack_into("<LL", buffer, offset, self.data["firmware_version"], self.data["firmware_version"])
+        offset = self._reconstruct_block_into(buffer, offset + 8, "0001_firmware_version_2")
+        struct.pack_into("<LL", buffer, offset, self.data["firmware_subversion"], self.data["firmware_subversion"])
+        # followed by 100 zero bytes
+
+    def _section_0002_unknown_size(self):
+        return len(self.BINARY_CONSTANT_BYTES["0002_unknown_1"]) + 2 + len(self.BINARY_CONSTANT_BYTES["0002_unknown_2"])
+
+    def _reconstruct_section_0002_unknown_into(self, buffer, offset):
+        offset = self._reconstruct_block_into(buffer, offset, "0002_unknown_1")
+        struct.pack_into("<H", buffer, offset, self.data["0002_unknown_x"])
+        self._reconstruct_block_into(buffer, offset + 2, "0002_unknown_2")
+
+    def _get_param_table(self):
+        params = self.data["params"]
+        if self.param_table is None or not self.param_table.matches(params):
+            self.param_table = ParamTable.from_keys(params.keys())
+        return self.param_table
+
+    def _section_0018_current_params_size(self):
+        return self.CURRENT_PARAM_RECORD.size * (len(self.data["params"]) + 1)
+
+    def _reconstruct_section_0018_current_params_into(self, buffer, offset):
+        record = self.CURRENT_PARAM_RECORD
+        for block_id, param_id, key in self._get_param_table():
+            record.pack_into(buffer, offset, block_id, param_id, self.data["params"][key]["current"])
+            offset += record.size
+        # followed by a zeroed terminating record
+
+    def _section_0006_max_min_default_unit_params_size(self):
+        return self.MAX_MIN_DEFAULT_UNIT_RECORD.size * len(self.data["params"]) + len(self.MAX_MIN_DEFAULT_UNIT_END_RECORD)
+
+    def _reconstruct_section_0006_max_min_default_unit_params_into(self, buffer, offset):
+        record = self.MAX_MIN_DEFAULT_UNIT_RECORD
+        for block_id, param_id, key in self._get_param_table():
+            param = self.data["params"][key]
+            max_value, min_value, default_value = param["max"], param["min"], param["default"]
+            # Values are stored with swapped 16-bit words, see swap_words()
+            record.pack_into(buffer, offset, block_id, param_id,
+                    max_value >> 16, max_value & 0xffff,
+                    min_value >> 16, min_value & 0xffff,
+                    default_value >> 16, default_value & 0xffff,
+                    param["unit"], self.UNIT_PARAM_PADDING)
+            offset += record.size
+        # followed by a zeroed terminating record
+
+    def _section_0007_null_block_size(self):
+        return 0x30
+
+    def _reconstruct_section_0007_null_block_into(self, buffer, offset):
+        pass
+
+    def _section_0008_numbered_null_blocks_size(self):
+        return 16 + self.NULL_BLOCK_COUNT * (16 + 0x80)
+
+    def _reconstruct_section_0008_numbered_null_blocks_into(self, buffer, offset):
+        struct.pack_into("<H", buffer, offset, self.NULL_BLOCK_COUNT)
+        offset += 16
+        for null_id in range(self.NULL_BLOCK_COUNT):
+            struct.pack_into("<H", buffer, offset, null_id)
+            offset += 16 + 0x80
 
     def reconstruct(self):
-        self.binary_reconstruct = b''
-        self._reconstruct_block("magic")
-        self._reconstruct_storage_mode()
-        self._reconstruct_asdasoft_version_string()
-        self._reconstruct_block("before_table")
-        self._reconstruct_section_table()
-        self._reconstruct_sections()
+        """Rebuild the binary .par file from self.data.
+
+        The section sizes are computed up front, so the whole file is written
+        into a single preallocated (and zero-filled) bytearray.
+        """
+        start = time.perf_counter()
+        version_string = self._reconstruct_asdasoft_version_string_to_array()
+        size, layout = self._reconstruct_layout(version_string)
+        buffer = bytearray(size)
+
+        offset = self._reconstruct_block_into(buffer, 0, "magic")
+        struct.pack_into("<L", buffer, offset, self.data["storage_mode"])
+        offset += 4
+        buffer[offset : offset + len(version_string)] = version_string
+        offset = self._reconstruct_block_into(buffer, offset + len(version_string), "before_table")
+        for row in self.data["section_table"]:
+            struct.pack_into("<HL", buffer, offset, row["section_type"], row["section_offset"])
+            offset += self.SECTION_HEADER_LEN
+
+        for section_type, offset, section_length, write_content_into in layout:
+            struct.pack_into("<HL", buffer, offset, section_type, section_length)
+            write_content_into(buffer, offset + self.SECTION_HEADER_LEN)
+        self.binary_reconstruct = buffer
+        self._report_stats("reconstruct", start, size)
 
     def simple_print(self):
-        print(self.to_json())
+        self.write_json(sys.stdout)
 
     def to_json(self):
-        return json.dumps(self.data, indent=4, sort_keys=True)
+        import json
+        start = time.perf_counter()
+        json_string = json.dumps(self.data, indent=4, sort_keys=True)
+        self._report_stats("json_encode", start, len(json_string))
+        return json_string
+
+    def write_json(self, fp):
+        """Write to_json() and a newline to a text file, without building the whole string.
+
+        The encoder output is written in pieces of JSON_WRITE_CHUNKS tokens,
+        so the first bytes go out before the rest of the document is rendered.
+        """
+        import json
+        start = time.perf_counter()
+        size = 0
+        chunks = json.JSONEncoder(indent=4, sort_keys=True).iterencode(self.data)
+        while True:
+            text = "".join(itertools.islice(chunks, self.JSON_WRITE_CHUNKS))
+            if not text:
+                break
+            fp.write(text)
+            size += len(text)
+        fp.write("\n")
+        self._report_stats("json_encode", start, size + 1)
 
     def from_json(self, json_string):
+        import json
         self.data = json.loads(json_string)
+        self.param_table = None
 
     def from_json_file(self, json_file):
+        import json
         with open(json_file, "r") as f:
             self.data = json.load(f)
-
-
-def main():
-    if len(sys.argv) in [2, 3]:
-        filename_in = sys.argv[1]
-
-        parser = ASDAParser()
-        parser.load_param_file(filename_in)
-        parser.parse()
-
-        if len(sys.argv) == 2:
-            parser.simple_print()
+        self.param_table = None
+
+
+def convert_par_to_json(filename_in, filename_out, stats_hook=None, opaque_unknown_sections=False):
+    parser = ASDAParser(opaque_unknown_sections)
+    if stats_hook is not None:
+        parser.add_stats_hook(stats_hook)
+    parser.load_param_file(filename_in)
+    parser.parse()
+    with open(filename_out, "w") as f:
+        parser.write_json(f)
+    parser.reconstruct()
+    parser.assert_reconstruction_correct()
+
+
+def convert_par_to_json_with_stats(filename_in, filename_out, opaque_unknown_sections=False):
+    convert_par_to_json(filename_in, filename_out, _stderr_stats_hook(filename_in), opaque_unknown_sections)
+
+
+def _cache_version(opaque_unknown_sections):
+    # Files with unknown sections render only in the opaque mode, keep them apart
+    if opaque_unknown_sections:
+        return "{}-opaque".format(ASDAParser.PARSER_VERSION)
+    return ASDAParser.PARSER_VERSION
+
+
+def render_par_to_json(binary, cache=None, stats_hook=None, opaque_unknown_sections=False, parser_class=ASDAParser):
+    """Return the verified JSON text (with a trailing newline) for .par content.
+
+    parser_class must produce the same output as ASDAParser (e.g. the NumPy
+    backend), as it is not part of the cache key.
+    """
+    if cache is not None:
+        start = time.perf_counter()
+        key = cache.key(binary, _cache_version(opaque_unknown_sections))
+        json_string = cache.get(key)
+        if json_string is not None:
+            if stats_hook is not None:
+                stats_hook({"stage": "cache_hit", "seconds": time.perf_counter() - start, "bytes": len(binary)})
+            return json_string
+
+    parser = parser_class(opaque_unknown_sections)
+    if stats_hook is not None:
+        parser.add_stats_hook(stats_hook)
+    parser.load_param_file(binary)
+    parser.parse()
+    json_string = parser.to_json() + "\n"
+    parser.reconstruct()
+    parser.assert_reconstruction_correct()
+    if cache is not None:
+        cache.put(key, json_string)
+    return json_string
+
+
+def print_par_file(filename_in, cache=None, stats_hook=None, opaque_unknown_sections=False):
+    with open(filename_in, "rb") as f:
+        binary = f.read()
+    if cache is not None:
+        sys.stdout.write(render_par_to_json(binary, cache, stats_hook, opaque_unknown_sections))
+        return
+
+    # Without a cache, the JSON is streamed to stdout before verification
+    parser = ASDAParser(opaque_unknown_sections)
+    if stats_hook is not None:
+        parser.add_stats_hook(stats_hook)
+    parser.load_param_file(binary)
+    parser.parse()
+    parser.write_json(sys.stdout)
+    parser.reconstruct()
+    parser.assert_reconstruction_correct()
+
+
+def _stderr_stats_hook(filename):
+    """Stats hook printing one JSON object per stage to stderr."""
+    import json
+
+    def hook(record):
+        record = dict(record, file=filename)
+        print(json.dumps(record, sort_keys=True), file=sys.stderr)
+    return hook
+
+
+def _import_sibling_module(name):
+    """Import another module of asda_tools.
+
+    Works both inside the package and when this file is run (or copied) as
+    a standalone script. In the latter case, only the file next to this
+    one is used, never a module of the same name elsewhere on sys.path.
+    Raises ImportError when it is missing.
+    """
+    if __package__:
+        return importlib.import_module("." + name, __package__)
+    module_name = "_asda_tools_" + name
+    if module_name not in sys.modules:
+        filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), name + ".py")
+        if not os.path.isfile(filename):
+            raise ImportError("{} is needed next to {}".format(filename, os.path.basename(__file__)), name=name)
+        spec = importlib.util.spec_from_file_location(module_name, filename)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[module_name] = module
+    return sys.modules[module_name]
+
+
+def _open_cache(directory=None):
+    """Return a TextconvCache, or None (with a warning) when cache.py is not available."""
+    try:
+        cache_module = _import_sibling_module("cache")
+    except ImportError as e:
+        print("Warning: cache disabled: {}".format(e), file=sys.stderr)
+        return None
+    max_size = int(os.environ.get("ASDA_TOOLS_CACHE_SIZE", cache_module.DEFAULT_MAX_SIZE))
+    return cache_module.TextconvCache(directory, max_size)
+
+
+def _batch_main(argv, convert, suffix_in, suffix_out, prog=None):
+    try:
+        batch_module = _import_sibling_module("batch")
+    except ImportError as e:
+        print("Error: {}".format(e), file=sys.stderr)
+        return 2
+    return batch_module.main(argv, convert, suffix_in, suffix_out, prog)
+
+
+MAIN_OPTIONS = ("--cache", "--stats", "--opaque-unknown")
+
+
+def _split_main_args(args):
+    """Return (options, positional arguments, error message or None).
+
+    Options are accepted anywhere before "--"; everything after "--batch"
+    is left to the batch argument parser.
+    """
+    options = set()
+    positional = []
+    args = iter(args)
+    for arg in args:
+        if arg == "--":
+            positional.extend(args)
+        elif arg == "--batch" and not positional:
+            positional.append(arg)
+            positional.extend(args)
+        elif arg in MAIN_OPTIONS:
+            options.add(arg)
+        elif arg.startswith("--"):
+            return options, positional, "Unknown option {}".format(arg)
+        else:
+            positional.append(arg)
+    return options, positional, None
+
+
+def main(argv=None, prog=None):
+    prog = prog or "python3 " + sys.argv[0]
+    options, args, error = _split_main_args(sys.argv[1:] if argv is None else argv)
+    if error is not None or (args[:1] != ["--batch"] and not 1 <= len(args) <= 2):
+        if error is not None:
+            print(error, file=sys.stderr)
+        print("Usage: {} [--cache] [--stats] [--opaque-unknown] input_file.par [output_file.json]".format(prog), file=sys.stderr)
+        print("       {} [--stats] [--opaque-unknown] --batch [-j JOBS] [-o OUTPUT_DIR] DIRECTORY_OR_GLOB...".format(prog), file=sys.stderr)
+        sys.exit(2)
+
+    opaque = "--opaque-unknown" in options
+    cache = None
+    if "--cache" in options or os.environ.get("ASDA_TOOLS_CACHE_DIR"):
+        cache = _open_cache(os.environ.get("ASDA_TOOLS_CACHE_DIR"))
+    stats_hook = _stderr_stats_hook(args[0]) if "--stats" in options else None
+
+    if args[0] == "--batch":
+        if "--stats" in options:
+            convert = functools.partial(convert_par_to_json_with_stats, opaque_unknown_sections=opaque)
         else:
-            filename_out = sys.argv[2]
-            with open(filename_out, "w") as f:
-                print(parser.to_json(), file=f)
-        parser.reconstruct()
-        parser.assert_reconstruction_correct()
+            convert = functools.partial(convert_par_to_json, opaque_unknown_sections=opaque)
+        sys.exit(_batch_main(args[1:], convert, ".par", ".json", prog))
+    elif len(args) == 1:
+        print_par_file(args[0], cache, stats_hook, opaque)
     else:
-        print("Usage: python3 {} input_file.par [output_file.json]".format(sys.argv[0]), file=sys.stderr)
-
+        convert_par_to_json(args[0], args[1], stats_hook, opaque)
 
 if __name__ == "__main__":
     main()
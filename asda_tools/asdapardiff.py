@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+
+from .asdapar2json import ASDAParser, parse_param_key
+from .batch import find_input_files
+
+
+# Top level values compared in addition to the parameters
+FIELDS = ["firmware_version", "firmware_subversion", "storage_mode", "asdasoft_version_string", "0002_unknown_x"]
+PARAM_FIELDS = ["current", "min", "max", "default", "unit"]
+
+
+def load_parsed(filename):
+    parser = ASDAParser()
+    parser.load_param_file(filename)
+    parser.parse()
+    return parser.data
+
+
+def diff_data(old, new):
+    """Compare two parsed files (ASDAParser.data).
+
+    Returns a list of (name, field, old_value, new_value). For top level
+    values the field is None; for parameters missing on one side both the
+    field and the missing value are None.
+    """
+    changes = []
+    for name in FIELDS:
+        if old.get(name) != new.get(name):
+            changes.append((name, None, old.get(name), new.get(name)))
+
+    old_params = old["params"]
+    new_params = new["params"]
+    for key in sorted(old_params.keys() | new_params.keys(), key=parse_param_key):
+        old_param = old_params.get(key)
+        new_param = new_params.get(key)
+        if old_param is None or new_param is None:
+            changes.append((key, None, old_param, new_param))
+            continue
+        for field in PARAM_FIELDS:
+            if old_param[field] != new_param[field]:
+                changes.append((key, field, old_param[field], new_param[field]))
+    return changes
+
+
+def format_text(filename, changes):
+    lines = []
+    for name, field, old_value, new_value in changes:
+        if field is not None:
+            lines.append("{}: {} {}: {} -> {}".format(filename, name, field, old_value, new_value))
+        elif name in FIELDS:
+            lines.append("{}: {}: {} -> {}".format(filename, name, json.dumps(old_value), json.dumps(new_value)))
+        elif old_value is None:
+            lines.append("{}: {}: only in this file".format(filename, name))
+        else:
+            lines.append("{}: {}: missing".format(filename, name))
+    return "\n".join(lines)
+
+
+def format_json(filename, changes):
+    return json.dumps({
+            "file": filename,
+            "changes": [{"name": name, "field": field, "old": old_value, "new": new_value} for name, field, old_value, new_value in changes],
+            }, sort_keys=True)
+
+
+def main(argv=None, prog="asdapar-diff"):
+    arg_parser = argparse.ArgumentParser(
+            prog=prog,
+            description="Compare parameters of .par files with a reference file. Prints only changed values.")
+    arg_parser.add_argument("reference", help="reference (golden) .par file")
+    arg_parser.add_argument("targets", nargs="+", metavar="FILE_DIRECTORY_OR_GLOB",
+            help=".par files to compare; directories are searched recursively")
+    arg_parser.add_argument("--json", action="store_true",
+            help="print one JSON object per compared file")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        reference = load_parsed(args.reference)
+    except Exception as e:
+        print("{}: {}: {}".format(args.reference, type(e).__name__, e), file=sys.stderr)
+        return 2
+    formatter = format_json if args.json else format_text
+    exit_code = 0
+    for base_directory, filename in find_input_files(args.targets, ".par"):
+        try:
+            changes = diff_data(reference, load_parsed(filename))
+        except Exception as e:
+            print("{}: {}: {}".format(filename, type(e).__name__, e), file=sys.stderr)
+            exit_code = 2
+            continue
+        if changes or args.json:
+            print(formatter(filename, changes))
+        if changes and exit_code == 0:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+
+from .asdapar2json import ASDAParseError
+from .lazy import LazyASDAReader
+
+
+def parse_assignment(assignment):
+    """Parse "P1-44=16" (values may also be hex or negative) into ("P1-44", 16)."""
+    key, separator, value = assignment.partition("=")
+    if not separator:
+        raise ValueError("Expected PARAM=VALUE, got {!r}".format(assignment))
+    return key.strip(), int(value.strip(), 0)
+
+
+def set_params(filename, assignments, check_limits=True):
+    """Change current values of parameters in place.
+
+    All values are checked before anything is written, so the file is left
+    untouched when any of them is invalid. Returns a list of
+    (key, old_value, new_value).
+    """
+    with LazyASDAReader(filename, writable=True) as reader:
+        values = [(key, reader.check_current(key, value, check_limits)) for key, value in assignments]
+        changes = [(key, reader.set_current(key, value, check_limits=False), value) for key, value in values]
+        reader.flush()
+    return changes
+
+
+def main(argv=None, prog="asdapar-set"):
+    arg_parser = argparse.ArgumentParser(
+            prog=prog,
+            description="Change current values of parameters directly in a .par file.")
+    arg_parser.add_argument("filename", help=".par file to modify in place")
+    arg_parser.add_argument("assignments", nargs="+", metavar="PARAM=VALUE",
+            help="e.g. P1-44=16; values can be decimal, hexadecimal (0x...) or negative")
+    arg_parser.add_argument("--force", action="store_true",
+            help="allow values outside of the parameter min/max limits")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        assignments = [parse_assignment(assignment) for assignment in args.assignments]
+        changes = set_params(args.filename, assignments, check_limits=not args.force)
+    except (KeyError, ValueError, ASDAParseError, OSError) as e:
+        print("{}: {}".format(args.filename, e), file=sys.stderr)
+        return 1
+    for key, old_value, new_value in changes:
+        print("{}: {} -> {}".format(key, old_value, new_value))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+
+
+def _glob_base(pattern):
+    """Return the leading directories of a glob pattern which contain no wildcards."""
+    components = os.path.normpath(pattern).split(os.sep)[:-1]
+    base = []
+    for component in components:
+        if any(char in component for char in "*?["):
+            break
+        base.append(component)
+    return os.sep.join(base) if base != [""] else os.sep
+
+
+def find_input_files(patterns, suffix):
+    """Expand directories (recursively) and glob patterns.
+
+    Yields (base_directory, filename) pairs, where base_directory is the
+    part of the path which is not mirrored into the output tree: the
+    directory itself, the part of a glob pattern before the first
+    wildcard, or the directory of a single file. With several inputs, the
+    common path of all of them is used, so that e.g. fleet/drive1/a.par and
+    other/drive1/a.par keep apart in the output tree.
+    """
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            filenames = []
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                filenames.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(suffix))
+            inputs.append((pattern, filenames))
+        elif os.path.isfile(pattern):
+            inputs.append((os.path.dirname(pattern), [pattern]))
+        else:
+            filenames = [filename for filename in sorted(glob.glob(pattern))
+                    if filename.lower().endswith(suffix) and os.path.isfile(filename)]
+            inputs.append((_glob_base(pattern), filenames))
+
+    if len(inputs) > 1:
+        common_base = os.path.commonpath([os.path.abspath(base_directory or ".") for base_directory, filenames in inputs])
+        inputs = [(common_base, filenames) for base_directory, filenames in inputs]
+    for base_directory, filenames in inputs:
+        for filename in filenames:
+            yield base_directory, filename
+
+
+def output_filename(base_directory, filename_in, suffix, output_directory=None):
+    if output_directory is None:
+        return os.path.splitext(filename_in)[0] + suffix
+    relative_name = os.path.splitext(os.path.relpath(filename_in, base_directory or "."))[0] + suffix
+    return os.path.join(output_directory, relative_name)
+
+
+def split_output_conflicts(jobs):
+    """Separate jobs which would write the same output file.
+
+    Returns (jobs, failures): the jobs which can run, and (filename_in,
+    exception) pairs for every input whose output is shared with another
+    input. An input listed more than once is converted only once.
+    """
+    def normalized(filename):
+        return os.path.normcase(os.path.abspath(filename))
+
+    inputs_by_output = {}
+    for filename_in, filename_out in jobs:
+        inputs = inputs_by_output.setdefault(normalized(filename_out), [])
+        if normalized(filename_in) not in map(normalized, inputs):
+            inputs.append(filename_in)
+    runnable = []
+    failures = []
+    for filename_in, filename_out in jobs:
+        inputs = inputs_by_output.pop(normalized(filename_out), None)
+        if inputs is None:
+            continue
+        if len(inputs) == 1:
+            runnable.append((filename_in, filename_out))
+            continue
+        for conflicting_input in inputs:
+            others = ", ".join(other for other in inputs if other != conflicting_input)
+            failures.append((conflicting_input, ValueError("Output file {} would be written also for {}".format(filename_out, others))))
+    return runnable, failures
+
+
+def run_batch(convert, jobs, max_workers=None):
+    """Run convert(filename_in, filename_out) for every job.
+
+    Failures are reported on stderr and do not stop other conversions.
+    Returns a list of (filename_in, exception) pairs.
+    """
+    failures = []
+    for filename_in, filename_out in jobs:
+        output_directory = os.path.dirname(filename_out)
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+
+    def report(filename_in, error):
+        print("{}: {}: {}".format(filename_in, type(error).__name__, error), file=sys.stderr)
+        failures.append((filename_in, error))
+
+    if max_workers == 1:
+        for filename_in, filename_out in jobs:
+            try:
+                convert(filename_in, filename_out)
+            except Exception as e:
+                report(filename_in, e)
+        return failures
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        futures = {executor.submit(convert, filename_in, filename_out): filename_in for filename_in, filename_out in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                report(futures[future], e)
+    return failures
+
+
+def _positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: {!r}".format(text))
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(value))
+    return value
+
+
+def main(argv, convert, suffix_in, suffix_out, prog=None):
+    arg_parser = argparse.ArgumentParser(
+            prog="{} --batch".format(prog or os.path.basename(sys.argv[0])),
+            description="Convert every {} file found in the given directories or glob patterns to {}.".format(suffix_in, suffix_out))
+    arg_parser.add_argument("inputs", nargs="+", metavar="DIRECTORY_OR_GLOB")
+    arg_parser.add_argument("-o", "--output-dir",
+            help="write output files into a mirror of the input tree rooted here (default: next to the input files)")
+    arg_parser.add_argument("-j", "--jobs", type=_positive_int, default=None,
+            help="number of worker processes (default: number of CPUs)")
+    args = arg_parser.parse_args(argv)
+
+    jobs = [(filename_in, output_filename(base_directory, filename_in, suffix_out, args.output_dir))
+            for base_directory, filename_in in find_input_files(args.inputs, suffix_in)]
+    jobs, failures = split_output_conflicts(jobs)
+    for filename_in, error in failures:
+        print("{}: {}: {}".format(filename_in, type(error).__name__, error), file=sys.stderr)
+    total = len(jobs) + len(failures)
+    failures += run_batch(convert, jobs, args.jobs)
+    print("Converted {} of {} files".format(total - len(failures), total), file=sys.stderr)
+    return 1 if failures else 0
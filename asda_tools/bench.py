@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Benchmark of the parser stages on synthetic .par files.
+
+Run as "python -m asda_tools.bench --help".
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .asdapar2json import ASDAParser, param_key
+
+
+# Number of parameters in each block of an ASDA-A2 file
+A2_BLOCK_LENGTHS = [64, 99, 97, 14, 25, 100, 100, 28]
+A2_SECTION_TYPES = [0x0001, 0x0002, 0x0018, 0x0006, 0x0007, 0x0008]
+STAGES = ["load_param_file", "parse", "to_json", "from_json", "reconstruct", "assert_reconstruction_correct"]
+
+
+def synthesize_data(block_lengths=A2_BLOCK_LENGTHS, section_types=A2_SECTION_TYPES, seed=0):
+    """Return ASDAParser.data of a valid file with random parameter values.
+
+    section_types gives the order of the sections; 0x0018 has to come
+    before 0x0006.
+    """
+    rng = random.Random(seed)
+    params = {}
+    for block_id, block_length in enumerate(block_lengths):
+        for param_id in range(block_length):
+            min_value = rng.randrange(0, 1000)
+            max_value = min_value + rng.randrange(0, 1 << 20)
+            params[param_key(block_id, param_id)] = {
+                    "current": rng.randint(min_value, max_value),
+                    "min": min_value,
+                    "max": max_value,
+                    "default": rng.randint(min_value, max_value),
+                    "unit": rng.randrange(1 << 16),
+                    }
+
+    parser = ASDAParser()
+    parser.data = {
+            "0002_unknown_x": 97,
+            "asdasoft_version_string": "Version :V5.4.1.0",
+            "firmware_version": 1054,
+            "firmware_subversion": 697,
+            "storage_mode": 1,
+            "params": params,
+            "section_table": [{"section_type": section_type} for section_type in section_types],
+            }
+    parser.update_section_table()
+    return parser.data
+
+
+def synthesize_par(block_lengths=A2_BLOCK_LENGTHS, section_types=A2_SECTION_TYPES, seed=0):
+    """Return the binary content of a synthetic .par file."""
+    parser = ASDAParser()
+    parser.data = synthesize_data(block_lengths, section_types, seed)
+    parser.reconstruct()
+    return bytes(parser.binary_reconstruct)
+
+
+def random_section_types(rng):
+    section_types = list(A2_SECTION_TYPES)
+    rng.shuffle(section_types)
+    # Parameter limits (0x0006) can only be loaded after the current values (0x0018)
+    if section_types.index(0x0006) < section_types.index(0x0018):
+        section_types.remove(0x0018)
+        section_types.insert(section_types.index(0x0006), 0x0018)
+    return section_types
+
+
+def _time_stages(parser_class, filename):
+    """Run all stages once on a file, return {stage: seconds}."""
+    times = {}
+
+    def timed(stage, function, *args):
+        start = time.perf_counter()
+        ret = function(*args)
+        times[stage] = time.perf_counter() - start
+        return ret
+
+    parser = parser_class()
+    timed("load_param_file", parser.load_param_file, filename)
+    timed("parse", parser.parse)
+    json_string = timed("to_json", parser.to_json)
+    writer = parser_class()
+    timed("from_json", writer.from_json, json_string)
+    timed("reconstruct", parser.reconstruct)
+    timed("assert_reconstruction_correct", parser.assert_reconstruction_correct)
+    return times
+
+
+def run_benchmark(filenames, parser_class=ASDAParser, repeat=3):
+    """Time every stage on every file, keeping the best of `repeat` runs.
+
+    Returns a dict with per-stage totals, throughput and peak memory.
+    """
+    if not filenames:
+        raise ValueError("No files to benchmark")
+    total_bytes = sum(os.path.getsize(filename) for filename in filenames)
+    stage_times = dict.fromkeys(STAGES, 0.0)
+    for filename in filenames:
+        best = None
+        for _ in range(repeat):
+            times = _time_stages(parser_class, filename)
+            best = times if best is None else {stage: min(best[stage], times[stage]) for stage in STAGES}
+        for stage in STAGES:
+            stage_times[stage] += best[stage]
+
+    tracemalloc.start()
+    try:
+        _time_stages(parser_class, filenames[0])
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    results = {
+            "parser": parser_class.__name__,
+            "files": len(filenames),
+            "bytes": total_bytes,
+            "peak_memory_per_file": peak_memory,
+            "stages": {},
+            }
+    for stage in STAGES:
+        seconds = stage_times[stage]
+        results["stages"][stage] = {
+                "seconds": seconds,
+                "files_per_second": len(filenames) / seconds if seconds else None,
+                "megabytes_per_second": total_bytes / seconds / 1e6 if seconds else None,
+                }
+    return results
+
+
+def format_results(results):
+    lines = ["{} on {} files ({} bytes), peak memory per file {} bytes".format(
+        results["parser"], results["files"], results["bytes"], results["peak_memory_per_file"])]
+    lines.append("{:32} {:>10} {:>10} {:>10}".format("stage", "seconds", "files/s", "MB/s"))
+    for stage in STAGES:
+        stage_results = results["stages"][stage]
+        lines.append("{:32} {:10.4f} {:10.1f} {:10.1f}".format(
+            stage, stage_results["seconds"], stage_results["files_per_second"] or 0, stage_results["megabytes_per_second"] or 0))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m asda_tools.bench", description=__doc__.splitlines()[0])
+    arg_parser.add_argument("files", nargs="*", help=".par files to benchmark (default: synthetic files)")
+    arg_parser.add_argument("--synthetic", type=int, default=20, metavar="N",
+            help="number of synthetic files to generate when no files are given (default: %(default)s)")
+    arg_parser.add_argument("--params-per-block", type=int, default=None, metavar="N",
+            help="parameters in each of the 8 blocks of synthetic files (default: ASDA-A2 layout)")
+    arg_parser.add_argument("--shuffle-sections", action="store_true",
+            help="use random section table layouts for synthetic files")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs per file, the best is kept (default: %(default)s)")
+    arg_parser.add_argument("--numpy", action="store_true", help="benchmark the NumPy backend")
+    arg_parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = arg_parser.parse_args(argv)
+    if not args.files and args.synthetic < 1:
+        arg_parser.error("--synthetic needs at least 1 file")
+
+    if args.numpy:
+        from .numpy_backend import NumpyASDAParser as parser_class
+    else:
+        parser_class = ASDAParser
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filenames = args.files
+        if not filenames:
+            rng = random.Random(0)
+            block_lengths = A2_BLOCK_LENGTHS if args.params_per_block is None else [args.params_per_block] * len(A2_BLOCK_LENGTHS)
+            for index in range(args.synthetic):
+                section_types = random_section_types(rng) if args.shuffle_sections else A2_SECTION_TYPES
+                filename = os.path.join(tmp_dir, "synthetic_{:04d}.par".format(index))
+                with open(filename, "wb") as f:
+                    f.write(synthesize_par(block_lengths, section_types, seed=index))
+                filenames.append(filename)
+        results = run_benchmark(filenames, parser_class, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=4, sort_keys=True))
+    else:
+        print(format_results(results))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import sys
+
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+def default_cache_directory():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "asda_tools")
+
+
+class TextconvCache(object):
+    """Content-addressed on-disk cache of rendered output.
+
+    Entries are keyed by a hash of the input bytes and the parser version.
+    Every entry is written to a temporary file and atomically renamed, so
+    concurrent processes (e.g. several git commands) never see partial
+    entries. Least recently used entries (by mtime, which is refreshed on
+    every hit) are evicted once the cache grows over max_size bytes. The
+    total size is tracked in a small index file, so the cache directory is
+    only scanned when the tracked size goes over the limit (or the index is
+    missing). Concurrent writers can lose updates of the index; the next
+    scan corrects it.
+
+    The cache is best-effort: when its directory cannot be used, a warning
+    is printed once and the cache behaves as if it were empty.
+    """
+
+    SUFFIX = ".json"
+    SIZE_FILE = "size"
+    # An eviction frees space down to this fraction of max_size, so a full cache is not rescanned on every put()
+    EVICT_TO = 0.9
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory or default_cache_directory()
+        self.max_size = max_size
+        self.disabled = False
+
+    def key(self, binary, version):
+        digest = hashlib.sha256(str(version).encode())
+        digest.update(b"\x00")
+        digest.update(binary)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + self.SUFFIX)
+
+    def _disable(self, error):
+        if not self.disabled:
+            print("Warning: cache {} disabled: {}".format(self.directory, error), file=sys.stderr)
+        self.disabled = True
+
+    def get(self, key):
+        if self.disabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            # e.g. the directory is a file, or the entry is not valid UTF-8
+            self._disable(e)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return text
+
+    def put(self, key, text):
+        if self.disabled:
+            return
+        content = text.encode("utf-8")
+        try:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_atomically(path, content)
+            total_size = self._read_total_size()
+            if total_size is None or total_size + len(content) > self.max_size:
+                self.evict()
+            else:
+                self._write_atomically(os.path.join(self.directory, self.SIZE_FILE), str(total_size + len(content)).encode())
+        except OSError as e:
+            self._disable(e)
+
+    def _write_atomically(self, path, content):
+        import tempfile
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with open(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _read_total_size(self):
+        try:
+            with open(os.path.join(self.directory, self.SIZE_FILE), "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _entries(self):
+        for subdirectory in os.listdir(self.directory):
+            subdirectory = os.path.join(self.directory, subdirectory)
+            if not os.path.isdir(subdirectory):
+                continue
+            for name in os.listdir(subdirectory):
+                if name.endswith(self.SUFFIX):
+                    path = os.path.join(subdirectory, name)
+                    try:
+                        yield path, os.stat(path)
+                    except FileNotFoundError:
+                        pass
+
+    def evict(self):
+        """Scan the whole cache, evict if it is over max_size and update the size index."""
+        entries = list(self._entries())
+        total_size = sum(stat.st_size for path, stat in entries)
+        if total_size > self.max_size:
+            total_size = self._evict_entries(entries, total_size)
+        self._write_atomically(os.path.join(self.directory, self.SIZE_FILE), str(total_size).encode())
+
+    def _evict_entries(self, entries, total_size):
+        entries.sort(key=lambda entry: entry[1].st_mtime)
+        for path, stat in entries:
+            if total_size <= self.max_size * self.EVICT_TO:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                pass
+            total_size -= stat.st_size
+        return total_size
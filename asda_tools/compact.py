@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import array
+import bisect
+
+from .asdapar2json import ASDAParser, param_key, parse_param_key
+
+
+class CompactParFile(object):
+    """Parsed content of a .par file, kept in flat arrays.
+
+    Parameters are stored as parallel array("I") columns (one per value,
+    e.g. "current" or "unit"), ordered by one sorted column of
+    block_id << 16 | param_id. A file of ~500 parameters takes a few kB
+    instead of the ~180 kB of ASDAParser.data, and holds no reference to
+    the loaded or reconstructed binary. The usual dict view and the JSON
+    output (identical to ASDAParser.to_json()) are built on demand.
+    """
+
+    __slots__ = ("fields", "ids", "columns")
+
+    # Order of the value columns; a file has either all of them or a subset (e.g. only "current")
+    PARAM_FIELDS = ("current", "max", "min", "default", "unit")
+
+    def __init__(self, fields, ids, columns):
+        self.fields = fields
+        self.ids = ids
+        self.columns = columns
+
+    @classmethod
+    def from_data(cls, data):
+        """Build from ASDAParser.data."""
+        params = data["params"]
+        entries = sorted((parse_param_key(key), param) for key, param in params.items())
+        field_set = set(entries[0][1]) if entries else set()
+        if not field_set <= set(cls.PARAM_FIELDS):
+            raise ValueError("Unknown parameter fields: {}".format(", ".join(sorted(field_set - set(cls.PARAM_FIELDS)))))
+        for (block_id, param_id), param in entries:
+            if param.keys() != field_set:
+                raise ValueError("Parameter {} has different fields than the others".format(param_key(block_id, param_id)))
+        columns = {}
+        for field in cls.PARAM_FIELDS:
+            if field in field_set:
+                columns[field] = array.array("I", [param[field] for key, param in entries])
+        ids = array.array("I", [block_id << 16 | param_id for (block_id, param_id), param in entries])
+        fields = {name: value for name, value in data.items() if name != "params"}
+        return cls(fields, ids, columns)
+
+    @classmethod
+    def load(cls, source, parser_class=ASDAParser, verify=False):
+        """Parse a .par file (a path, file object or buffer, see ASDAParser.load_param_file()).
+
+        With verify, the file is also reconstructed and compared, as the
+        command line tools do. The parser and its buffers are dropped before
+        returning.
+        """
+        parser = parser_class()
+        parser.load_param_file(source)
+        parser.parse()
+        if verify:
+            parser.reconstruct()
+            parser.assert_reconstruction_correct()
+        return cls.from_data(parser.data)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _index(self, key):
+        block_id, param_id = parse_param_key(key) if isinstance(key, str) else key
+        packed_id = block_id << 16 | param_id
+        index = bisect.bisect_left(self.ids, packed_id)
+        if index == len(self.ids) or self.ids[index] != packed_id:
+            raise KeyError(param_key(block_id, param_id))
+        return index
+
+    def keys(self):
+        """Parameter names in numerical order, e.g. "P0-00", ..., "P1-44", ..."""
+        return [param_key(packed_id >> 16, packed_id & 0xffff) for packed_id in self.ids]
+
+    def value(self, key, field):
+        """Return one value, e.g. value("P1-44", "current"), without building a dict."""
+        return self.columns[field][self._index(key)]
+
+    def param(self, key):
+        """Return the values of one parameter, as in ASDAParser.data["params"][key]."""
+        index = self._index(key)
+        return {field: column[index] for field, column in self.columns.items()}
+
+    def params(self):
+        """Build the whole ASDAParser.data["params"] dict."""
+        names = list(self.columns)
+        return {key: dict(zip(names, values)) for key, values in zip(self.keys(), zip(*self.columns.values()))}
+
+    def to_data(self):
+        """Build ASDAParser.data; changes to it are not reflected back."""
+        data = dict(self.fields)
+        data["section_table"] = [dict(section) for section in self.fields.get("section_table", [])]
+        data["params"] = self.params()
+        return data
+
+    def _parser(self):
+        parser = ASDAParser()
+        parser.data = self.to_data()
+        return parser
+
+    def to_json(self):
+        return self._parser().to_json()
+
+    def write_json(self, fp):
+        self._parser().write_json(fp)
+
+    def reconstruct(self):
+        """Return the binary .par file."""
+        parser = self._parser()
+        parser.reconstruct()
+        return bytes(parser.binary_reconstruct)
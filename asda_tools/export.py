@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Export parameters of many .par files into one columnar table.
+
+Every row holds one parameter of one file. Files are parsed in a pool of
+worker processes and rows are written in batches, so memory use does not
+grow with the number of files. CSV needs no extra dependencies, Parquet and
+Arrow IPC output need pyarrow.
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import os
+import sys
+
+from .asdapar2json import ASDAParser, parse_param_key
+from .batch import find_input_files
+
+
+COLUMNS = ["file", "param", "block_id", "param_id", "current", "min", "max", "default", "unit",
+        "firmware_version", "storage_mode", "asdasoft_version_string"]
+
+
+def param_rows(filename):
+    """Parse one file and return its rows, ordered by (block_id, param_id)."""
+    parser = ASDAParser()
+    parser.load_param_file(filename)
+    parser.parse()
+    data = parser.data
+    rows = []
+    for key in sorted(data["params"], key=parse_param_key):
+        param = data["params"][key]
+        block_id, param_id = parse_param_key(key)
+        rows.append((filename, key, block_id, param_id, param["current"], param["min"], param["max"], param["default"], param["unit"],
+            data["firmware_version"], data["storage_mode"], data["asdasoft_version_string"]))
+    return rows
+
+
+def iter_file_rows(filenames, max_workers=None):
+    """Yield (filename, rows or exception) as files are parsed in worker processes.
+
+    At most a few files per worker are in flight, so finished results do not
+    pile up in memory.
+    """
+    filenames = iter(filenames)
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = 4 * max_workers
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        pending = {}
+        while True:
+            for filename in filenames:
+                pending[executor.submit(param_rows, filename)] = filename
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                return
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                filename = pending.pop(future)
+                try:
+                    yield filename, future.result()
+                except Exception as e:
+                    yield filename, e
+
+
+class CSVTableWriter(object):
+    def __init__(self, filename):
+        self.file = open(filename, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowTableWriter(object):
+    """Writes Parquet (format="parquet") or Arrow IPC (format="arrow") files."""
+
+    def __init__(self, filename, format):
+        try:
+            import pyarrow
+        except ImportError:
+            raise RuntimeError("{} output needs pyarrow (pip install pyarrow), use CSV otherwise".format(format.capitalize()))
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+                ("file", pyarrow.string()),
+                ("param", pyarrow.string()),
+                ("block_id", pyarrow.uint16()),
+                ("param_id", pyarrow.uint16()),
+                ("current", pyarrow.uint32()),
+                ("min", pyarrow.uint32()),
+                ("max", pyarrow.uint32()),
+                ("default", pyarrow.uint32()),
+                ("unit", pyarrow.uint16()),
+                ("firmware_version", pyarrow.uint32()),
+                ("storage_mode", pyarrow.uint32()),
+                ("asdasoft_version_string", pyarrow.string()),
+                ])
+        if format == "parquet":
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+        else:
+            import pyarrow.ipc
+            self.writer = pyarrow.ipc.new_file(filename, self.schema)
+
+    def write_rows(self, rows):
+        columns = [self.pyarrow.array(column, type=field.type) for column, field in zip(zip(*rows), self.schema)]
+        self.writer.write_batch(self.pyarrow.record_batch(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_table_writer(filename, format=None):
+    if format is None:
+        extension = os.path.splitext(filename)[1].lower()
+        format = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}.get(extension, "csv")
+    if format == "csv":
+        return CSVTableWriter(filename)
+    return ArrowTableWriter(filename, format)
+
+
+def export(filenames, writer, batch_rows=65536, max_workers=None):
+    """Write the rows of all files to writer. Returns a list of (filename, exception)."""
+    failures = []
+    batch = []
+    for filename, rows in iter_file_rows(filenames, max_workers):
+        if isinstance(rows, Exception):
+            print("{}: {}: {}".format(filename, type(rows).__name__, rows), file=sys.stderr)
+            failures.append((filename, rows))
+            continue
+        batch.extend(rows)
+        if len(batch) >= batch_rows:
+            writer.write_rows(batch)
+            batch = []
+    if batch:
+        writer.write_rows(batch)
+    return failures
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m asda_tools.export", description=__doc__.splitlines()[0])
+    arg_parser.add_argument("inputs", nargs="+", metavar="FILE_DIRECTORY_OR_GLOB",
+            help=".par files to export; directories are searched recursively")
+    arg_parser.add_argument("-o", "--output", required=True,
+            help="output file; the format follows from the extension (.csv, .parquet, .arrow/.feather)")
+    arg_parser.add_argument("--format", choices=["csv", "parquet", "arrow"], default=None,
+            help="output format, overrides the extension")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=None,
+            help="number of worker processes (default: number of CPUs)")
+    arg_parser.add_argument("--batch-rows", type=int, default=65536,
+            help="rows written at once (default: %(default)s)")
+    args = arg_parser.parse_args(argv)
+
+    filenames = (filename for base_directory, filename in find_input_files(args.inputs, ".par"))
+    writer = open_table_writer(args.output, args.format)
+    try:
+        failures = export(filenames, writer, args.batch_rows, args.jobs)
+    finally:
+        writer.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,33 @@
 #!/usr/bin/env python3
 
 import sys
-from asdapar2json import ASDAParser
 
-if __name__ == "__main__":
-    if len(sys.argv) == 3:
-        filename_in = sys.argv[1]
-        filename_out = sys.argv[2]
-
-        writer = ASDAParser()
-        writer.from_json_file(filename_in)
-        writer.reconstruct()
-        writer.write_reconstruction(filename_out)
+# Works both inside the package and when this file is run (or copied) as a standalone script
+if __package__:
+    from .asdapar2json import ASDAParser, _batch_main
+else:
+    from asdapar2json import ASDAParser, _batch_main
+
+
+def convert_json_to_par(filename_in, filename_out):
+    writer = ASDAParser()
+    writer.from_json_file(filename_in)
+    writer.reconstruct()
+    writer.write_reconstruction(filename_out)
+
+
+def main(argv=None, prog=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    prog = prog or "python3 " + sys.argv[0]
+    if args[:1] == ["--batch"]:
+        sys.exit(_batch_main(args[1:], convert_json_to_par, ".json", ".par", prog))
+    elif len(args) == 2:
+        convert_json_to_par(args[0], args[1])
     else:
-        print("Usage: python3 {} input_file.json output_file.par".format(sys.argv[0]), file=sys.stderr)
+        print("Usage: {} input_file.json output_file.par".format(prog), file=sys.stderr)
+        print("       {} --batch [-j JOBS] [-o OUTPUT_DIR] DIRECTORY_OR_GLOB...".format(prog), file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
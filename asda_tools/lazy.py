@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import mmap
+
+from .asdapar2json import ASDAParser, ASDAParseError, param_key, parse_param_key
+
+
+def _signed(value):
+    return value - (1 << 32) if value & (1 << 31) else value
+
+
+class LazyASDAReader(ASDAParser):
+    """Random access to single values of a .par file without a full parse().
+
+    Only the file header and the section table are read when the file is
+    opened. Sections are decoded (and validated) when a value from them is
+    requested, and parameters are looked up through a one-time offset index
+    of the 0x0018 and 0x0006 records. Paths are memory mapped, so only the
+    touched pages are read from disk. Use validate() to check the whole file.
+
+    Opened with writable=True, current values can be changed in place with
+    set_current(); only the touched records are rewritten.
+    """
+
+    # Top level values which live in a section rather than in the file header
+    FIELD_SECTIONS = {
+            "firmware_version": 0x0001,
+            "firmware_subversion": 0x0001,
+            "0002_unknown_x": 0x0002,
+            }
+
+    def __init__(self, source=None, writable=False):
+        super().__init__()
+        self._mmap = None
+        if source is not None:
+            self.open(source, writable)
+
+    def open(self, source, writable=False):
+        if isinstance(source, str) or hasattr(source, "__fspath__"):
+            with open(source, "r+b" if writable else "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+            source = self._mmap
+        try:
+            self.load_param_file(source)
+
+            self.data = {}
+            self.current_offset = 0
+            self._check_equal("magic")
+            self._load_storage_mode()
+            self._load_asdasoft_version_string()
+            self._check_equal("before_table")
+            self._load_section_table()
+        except BaseException:
+            # The caller never gets the reader (e.g. from __init__) to close it
+            self.close()
+            raise
+        self._loaded_sections = set()
+        self._param_index = {}
+
+    def flush(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+
+    def close(self):
+        super().close()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _find_section(self, section_type):
+        """Check the header of a section and return (section_number, section, expected_end)."""
+        for section_number, section in enumerate(self.data["section_table"]):
+            if section["section_type"] == section_type:
+                self.current_offset = section["section_offset"]
+                expected_end = self._load_and_check_section_header(section_number, section)
+                return section_number, section, expected_end
+        raise ASDAParseError("There is no section of type 0x{:04X} in the section table".format(section_type))
+
+    def load_section(self, section_type):
+        """Decode and validate one section into self.data, using the normal parser."""
+        if section_type in self._loaded_sections:
+            return
+        if section_type == 0x0006 and 0x0018 not in self._loaded_sections:
+            self.load_section(0x0018)
+        section_number, section, expected_end = self._find_section(section_type)
+        self._load_one_section(section_number, section, expected_end)
+        self._loaded_sections.add(section_type)
+
+    def field(self, name):
+        """Return a top level value, e.g. "firmware_version" or "storage_mode"."""
+        if name in self.FIELD_SECTIONS:
+            self.load_section(self.FIELD_SECTIONS[name])
+        return self.data[name]
+
+    def _index_section(self, section_type, record_size, end_record_size):
+        """Map (block_id, param_id) to the offset of its record in a section."""
+        if section_type in self._param_index:
+            return self._param_index[section_type]
+        section_number, section, expected_end = self._find_section(section_type)
+        end_record = bytes(end_record_size)
+        index = {}
+        offset = self.current_offset
+        while self.binary[offset : offset + end_record_size] != end_record:
+            if offset + record_size > expected_end:
+                raise ASDAParseError("Problem parsing section #{} (section type: 0x{:04X}): no terminating record before the expected end 0x{:04X}".format(section_number, section_type, expected_end))
+            index[self.PARAM_ID_RECORD.unpack_from(self.binary, offset)] = offset
+            offset += record_size
+        self._param_index[section_type] = index
+        return index
+
+    def _param_offset(self, section_type, record_size, end_record_size, block_id, param_id):
+        index = self._index_section(section_type, record_size, end_record_size)
+        try:
+            return index[(block_id, param_id)]
+        except KeyError:
+            raise KeyError(param_key(block_id, param_id))
+
+    def param_ids(self):
+        """Return the sorted (block_id, param_id) pairs of all parameters."""
+        return sorted(self._index_section(0x0018, self.CURRENT_PARAM_RECORD.size, self.CURRENT_PARAM_RECORD.size))
+
+    def _param_id(self, key):
+        if isinstance(key, str):
+            return parse_param_key(key)
+        return tuple(key)
+
+    def param(self, key):
+        """Return the values of one parameter, as in data["params"][key] after parse().
+
+        The key is either a name like "P1-44" or a (block_id, param_id) pair.
+        """
+        block_id, param_id = self._param_id(key)
+        current_record = self.CURRENT_PARAM_RECORD
+        offset = self._param_offset(0x0018, current_record.size, current_record.size, block_id, param_id)
+        value = {"current": current_record.unpack_from(self.binary, offset)[2]}
+
+        record = self.MAX_MIN_DEFAULT_UNIT_RECORD
+        offset = self._param_offset(0x0006, record.size, len(self.MAX_MIN_DEFAULT_UNIT_END_RECORD), block_id, param_id)
+        (block_id, param_id, max_low, max_high, min_low, min_high,
+                default_low, default_high, unit, padding) = record.unpack_from(self.binary, offset)
+        if padding != self.UNIT_PARAM_PADDING:
+            self.current_offset = offset + record.size - len(padding)
+            self._check_equal("0006_unit_param_unknown")
+        value["max"] = max_low << 16 | max_high
+        value["min"] = min_low << 16 | min_high
+        value["default"] = default_low << 16 | default_high
+        value["unit"] = unit
+        return value
+
+    def check_current(self, key, value, check_limits=True):
+        """Return value as stored in the file, or raise ValueError if it cannot be set.
+
+        Negative values are stored in two's complement. With check_limits,
+        the value has to be within the min and max of the parameter; the
+        limits are taken as signed when min is above max as unsigned values.
+        """
+        if -(1 << 31) <= value < 0:
+            value += 1 << 32
+        if not 0 <= value <= 0xffffffff:
+            raise ValueError("{}: value {} does not fit into 32 bits".format(param_key(*self._param_id(key)), value))
+        limits = self.param(key)
+        if check_limits:
+            min_value, max_value, checked_value = limits["min"], limits["max"], value
+            if min_value > max_value:
+                min_value, max_value, checked_value = [_signed(x) for x in (min_value, max_value, value)]
+            if not min_value <= checked_value <= max_value:
+                raise ValueError("{}: value {} is out of range {}..{}".format(param_key(*self._param_id(key)), checked_value, min_value, max_value))
+        return value
+
+    def set_current(self, key, value, check_limits=True):
+        """Overwrite the current value of one parameter in the loaded buffer.
+
+        Returns the previous value.
+        """
+        value = self.check_current(key, value, check_limits)
+        block_id, param_id = self._param_id(key)
+        record = self.CURRENT_PARAM_RECORD
+        offset = self._param_offset(0x0018, record.size, record.size, block_id, param_id)
+        old_value = record.unpack_from(self.binary, offset)[2]
+        record.pack_into(self.binary, offset, block_id, param_id, value)
+        if param_key(block_id, param_id) in self.data.get("params", {}):
+            self.data["params"][param_key(block_id, param_id)]["current"] = value
+        return old_value
+
+    def validate(self):
+        """Parse and check the whole file, as ASDAParser does."""
+        self.parse()
+        self.reconstruct()
+        self.assert_reconstruction_correct()
+        self._loaded_sections = set(section["section_type"] for section in self.data["section_table"])
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .asdapar2json import ASDAParser, ParamTable, param_key
+
+
+if numpy is not None:
+    CURRENT_PARAM_DTYPE = numpy.dtype([
+            ("block_id", "<u2"),
+            ("param_id", "<u2"),
+            ("current", "<u4"),
+            ])
+    MAX_MIN_DEFAULT_UNIT_DTYPE = numpy.dtype([
+            ("block_id", "<u2"),
+            ("param_id", "<u2"),
+            ("max", "<u4"),
+            ("min", "<u4"),
+            ("default", "<u4"),
+            ("unit", "<u2"),
+            ("padding", "u1", (len(ASDAParser.UNIT_PARAM_PADDING),)),
+            ])
+    assert CURRENT_PARAM_DTYPE.itemsize == ASDAParser.CURRENT_PARAM_RECORD.size
+    assert MAX_MIN_DEFAULT_UNIT_DTYPE.itemsize == ASDAParser.MAX_MIN_DEFAULT_UNIT_RECORD.size
+
+
+def swap_words_array(values):
+    """Vectorized ASDAParser.swap_words() for an array of uint32."""
+    values = numpy.asarray(values, dtype="<u4")
+    return (values >> 16) | (values << 16)
+
+
+class NumpyASDAParser(ASDAParser):
+    """ASDAParser decoding and encoding whole parameter sections with NumPy.
+
+    The fixed-layout records of sections 0x0018 and 0x0006 are mapped onto
+    structured dtypes. Whenever the data is not exactly what the fast path
+    expects (or NumPy is not installed), the pure-Python implementation is
+    used, so the output and error messages are always the same.
+    """
+
+    def _load_section_0018_current_params(self, expected_end):
+        if numpy is None:
+            return super()._load_section_0018_current_params(expected_end)
+
+        start = self.current_offset
+        count = max(min(expected_end, len(self.binary)) - start, 0) // CURRENT_PARAM_DTYPE.itemsize
+        records = numpy.frombuffer(self.binary, CURRENT_PARAM_DTYPE, count, start)
+        ends = numpy.flatnonzero((records["block_id"] == 0) & (records["param_id"] == 0) & (records["current"] == 0))
+        if not len(ends):
+            return super()._load_section_0018_current_params(expected_end)
+
+        records = records[:ends[0]]
+        self.data["params"] = {}
+        params = self.data["params"]
+        entries = []
+        for block_id, param_id, value in zip(records["block_id"].tolist(), records["param_id"].tolist(), records["current"].tolist()):
+            key = param_key(block_id, param_id)
+            if key not in params:
+                entries.append((block_id, param_id, key))
+            params[key] = {
+                    "current": value
+                    }
+        self.param_table = ParamTable(entries)
+        self.current_offset = start + (int(ends[0]) + 1) * CURRENT_PARAM_DTYPE.itemsize
+
+    def _load_section_0006_max_min_default_unit_params(self, expected_end):
+        if numpy is None:
+            return super()._load_section_0006_max_min_default_unit_params(expected_end)
+
+        start = self.current_offset
+        end_record = self.MAX_MIN_DEFAULT_UNIT_END_RECORD
+        count, remainder = divmod(expected_end - start - len(end_record), MAX_MIN_DEFAULT_UNIT_DTYPE.itemsize)
+        end_offset = expected_end - len(end_record)
+        if count < 0 or remainder or self.binary[end_offset : expected_end] != end_record:
+            return super()._load_section_0006_max_min_default_unit_params(expected_end)
+
+        records = numpy.frombuffer(self.binary, MAX_MIN_DEFAULT_UNIT_DTYPE, count, start)
+        padding = numpy.frombuffer(self.UNIT_PARAM_PADDING, numpy.uint8)
+        is_end = (records["block_id"] == 0) & (records["param_id"] == 0) & (records["max"] == 0) & (records["min"] == 0) & (records["default"] == 0)
+        if is_end.any() or not (records["padding"] == padding).all():
+            return super()._load_section_0006_max_min_default_unit_params(expected_end)
+
+        params = self.data["params"]
+        keys = [param_key(block_id, param_id) for block_id, param_id in zip(records["block_id"].tolist(), records["param_id"].tolist())]
+        if not all(key in params for key in keys):
+            return super()._load_section_0006_max_min_default_unit_params(expected_end)
+
+        columns = zip(keys,
+                swap_words_array(records["max"]).tolist(),
+                swap_words_array(records["min"]).tolist(),
+                swap_words_array(records["default"]).tolist(),
+                records["unit"].tolist())
+        for key, max_value, min_value, default_value, unit in columns:
+            param = params[key]
+            param["max"] = max_value
+            param["min"] = min_value
+            param["default"] = default_value
+            param["unit"] = unit
+        self.current_offset = expected_end
+
+    def _reconstruct_section_0018_current_params_into(self, buffer, offset):
+        if numpy is None:
+            return super()._reconstruct_section_0018_current_params_into(buffer, offset)
+
+        param_table = self._get_param_table()
+        # Writable view into the preallocated buffer; the zeroed record after it terminates the section
+        records = numpy.frombuffer(buffer, CURRENT_PARAM_DTYPE, len(param_table), offset)
+        records["block_id"] = param_table.block_ids
+        records["param_id"] = param_table.param_ids
+        records["current"] = [self.data["params"][key]["current"] for key in param_table.keys]
+
+    def _reconstruct_section_0006_max_min_default_unit_params_into(self, buffer, offset):
+        if numpy is None:
+            return super()._reconstruct_section_0006_max_min_default_unit_params_into(buffer, offset)
+
+        param_table = self._get_param_table()
+        params = [self.data["params"][key] for key in param_table.keys]
+        records = numpy.frombuffer(buffer, MAX_MIN_DEFAULT_UNIT_DTYPE, len(param_table), offset)
+        records["block_id"] = param_table.block_ids
+        records["param_id"] = param_table.param_ids
+        records["max"] = swap_words_array([param["max"] for param in params])
+        records["min"] = swap_words_array([param["min"] for param in params])
+        records["default"] = swap_words_array([param["default"] for param in params])
+        records["unit"] = [param["unit"] for param in params]
+        records["padding"] = numpy.frombuffer(self.UNIT_PARAM_PADDING, numpy.uint8)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Minimal git textconv client for the asdapar2json daemon.
+
+Usage: textconv_client.py [--cache] [--stats] [--opaque-unknown] input_file.par
+
+Sends the file to a running textconv_daemon and prints the JSON it returns;
+--opaque-unknown is passed on to the daemon, --cache is left to the daemon's
+own setting. If no daemon is listening, or with --stats (which measures the
+conversion in this process), the file is converted in this process instead,
+by asdapar2json. On Python 3.7 and newer the asda_tools package defers its
+parser import, so the fast path only imports this module and a few
+standard library ones.
+"""
+
+import os
+import socket
+import stat
+import struct
+import sys
+
+
+# Request: flags + length + .par content. Response: status + length + payload.
+REQUEST_HEADER = struct.Struct(">BQ")
+FLAG_OPAQUE_UNKNOWN = 0x01
+RESPONSE_HEADER = struct.Struct(">BQ")
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Options the daemon path honours; any other option makes the client convert in-process
+DAEMON_OPTIONS = {"--cache", "--opaque-unknown"}
+
+
+def default_socket_path():
+    if os.environ.get("ASDA_TOOLS_SOCKET"):
+        return os.environ["ASDA_TOOLS_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "asda_tools.sock")
+    return os.path.join("/tmp", "asda_tools-{}.sock".format(os.getuid()))
+
+
+def check_socket_path(socket_path):
+    """Raise PermissionError unless the socket can only have been created by this user.
+
+    The socket has to be owned by us, and its directory must not let other
+    users replace it (it is private, or sticky like /tmp). Raises
+    FileNotFoundError when there is no socket.
+    """
+    socket_stat = os.stat(socket_path)
+    if not stat.S_ISSOCK(socket_stat.st_mode) or socket_stat.st_uid != os.getuid():
+        raise PermissionError("{} is not a socket owned by the current user".format(socket_path))
+    directory_stat = os.stat(os.path.dirname(os.path.abspath(socket_path)))
+    if directory_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH) and not directory_stat.st_mode & stat.S_ISVTX:
+        raise PermissionError("Directory of {} is writable by other users".format(socket_path))
+
+
+def _check_peer(sock):
+    # Also closes the race between check_socket_path() and connect(), where the system reports the peer
+    if not hasattr(socket, "SO_PEERCRED"):
+        return
+    pid, uid, gid = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    if uid != os.getuid():
+        raise PermissionError("Daemon runs as user {}, not as the current user".format(uid))
+
+
+def _read_exactly(sock, length):
+    chunks = []
+    while length:
+        chunk = sock.recv(min(length, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed by the daemon")
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b"".join(chunks)
+
+
+def request(binary, socket_path=None, opaque_unknown_sections=False):
+    """Send .par content to the daemon, return (status, payload).
+
+    Raises OSError when the daemon is not running, and PermissionError
+    when the socket or the daemon belongs to another user.
+    """
+    socket_path = socket_path or default_socket_path()
+    check_socket_path(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        _check_peer(sock)
+        flags = FLAG_OPAQUE_UNKNOWN if opaque_unknown_sections else 0
+        sock.sendall(REQUEST_HEADER.pack(flags, len(binary)))
+        sock.sendall(binary)
+        status, length = RESPONSE_HEADER.unpack(_read_exactly(sock, RESPONSE_HEADER.size))
+        return status, _read_exactly(sock, length)
+
+
+def _run_in_process():
+    if __package__:
+        from .asdapar2json import main as asdapar2json_main
+    else:
+        from asdapar2json import main as asdapar2json_main
+    asdapar2json_main()
+
+
+def main():
+    options = {arg for arg in sys.argv[1:] if arg.startswith("--")}
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if options - DAEMON_OPTIONS:
+        # --stats, "--" and unknown options are handled (or reported) by asdapar2json
+        _run_in_process()
+        return 0
+    if len(args) != 1:
+        print(__doc__.splitlines()[2], file=sys.stderr)
+        return 2
+    with open(args[0], "rb") as f:
+        binary = f.read()
+    try:
+        status, payload = request(binary, opaque_unknown_sections="--opaque-unknown" in options)
+    except PermissionError as e:
+        print("Warning: not using the textconv daemon: {}".format(e), file=sys.stderr)
+        _run_in_process()
+        return 0
+    except OSError:
+        _run_in_process()
+        return 0
+    if status != STATUS_OK:
+        sys.stderr.write(payload.decode("utf-8", "replace") + "\n")
+        return 1
+    sys.stdout.buffer.write(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
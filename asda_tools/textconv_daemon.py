@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Long-running asdapar2json server for git textconv.
+
+Keeps the parser loaded and converts .par files sent by textconv_client
+over a Unix socket, so git does not pay interpreter startup and imports
+for every blob.
+"""
+
+import argparse
+import errno
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+
+from .asdapar2json import render_par_to_json, _open_cache
+from .textconv_client import REQUEST_HEADER, RESPONSE_HEADER, STATUS_OK, STATUS_ERROR, FLAG_OPAQUE_UNKNOWN, default_socket_path
+
+
+class TextconvRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        header = self.rfile.read(REQUEST_HEADER.size)
+        if len(header) != REQUEST_HEADER.size:
+            return
+        flags, length = REQUEST_HEADER.unpack(header)
+        binary = self.rfile.read(length)
+        try:
+            if len(binary) != length:
+                raise ValueError("Truncated request: expected {} bytes, got {}".format(length, len(binary)))
+            if flags & ~FLAG_OPAQUE_UNKNOWN:
+                raise ValueError("Unknown request flags 0x{:02X}".format(flags))
+            json_string = render_par_to_json(binary, self.server.cache, opaque_unknown_sections=bool(flags & FLAG_OPAQUE_UNKNOWN))
+            status, payload = STATUS_OK, json_string.encode("utf-8")
+        except Exception as e:
+            status, payload = STATUS_ERROR, "{}: {}".format(type(e).__name__, e).encode("utf-8")
+        self.wfile.write(RESPONSE_HEADER.pack(status, len(payload)))
+        self.wfile.write(payload)
+
+
+class TextconvServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path=None, cache=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.cache = cache
+        self._remove_stale_socket()
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(self.socket_path, TextconvRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def _remove_stale_socket(self):
+        """Remove a socket left over by a daemon which did not shut down cleanly.
+
+        Raises OSError when a daemon is still listening there, or when the
+        path is not a socket.
+        """
+        try:
+            mode = os.lstat(self.socket_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise OSError(errno.EEXIST, "Not a socket, refusing to replace it", self.socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except ConnectionRefusedError:
+                os.unlink(self.socket_path)
+                return
+            except FileNotFoundError:
+                return
+        raise OSError(errno.EADDRINUSE, "Another textconv daemon is listening", self.socket_path)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m asda_tools.textconv_daemon", description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--socket", default=None,
+            help="socket path (default: $ASDA_TOOLS_SOCKET, $XDG_RUNTIME_DIR/asda_tools.sock or /tmp/asda_tools-UID.sock)")
+    arg_parser.add_argument("--cache", action="store_true",
+            help="also use the on-disk textconv cache (see asdapar2json --cache)")
+    args = arg_parser.parse_args(argv)
+
+    cache = _open_cache(os.environ.get("ASDA_TOOLS_CACHE_DIR")) if args.cache or os.environ.get("ASDA_TOOLS_CACHE_DIR") else None
+    try:
+        server = TextconvServer(args.socket, cache)
+    except OSError as e:
+        print("Error: {}".format(e), file=sys.stderr)
+        return 1
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Listening on {}".format(server.socket_path), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,7 +19,11 @@ setuptools.setup(
         "License :: OSI Approved :: GNU General Public License v2 or later (GPLv2+)",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.4',
-    scripts=["bin/asdapar2json"],
+    python_requires='>=3.5',
+    extras_require={
+        "numpy": ["numpy"],
+        "arrow": ["pyarrow"],
+    },
+    scripts=["bin/asdapar2json", "bin/asdapar-diff", "bin/asdapar2json-client", "bin/asdapar-set"],
     test_suite = "test",
 )
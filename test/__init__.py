@@ -1,6 +1,32 @@
 import unittest
+import unittest.mock
+import asyncio
+import contextlib
+import csv
+import io
+import random
+import mmap
 import os.path
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
 from asda_tools import ASDAParser
+from asda_tools.aio import AsyncASDAParser
+from asda_tools.asdapar2json import ASDAParseError, ParamTable, SectionCodec, convert_par_to_json, _split_main_args, main as asdapar2json_main
+from asda_tools.asdapardiff import diff_data, load_parsed, main as asdapardiff_main
+from asda_tools.asdaparset import set_params, main as asdaparset_main
+from asda_tools.bench import random_section_types, synthesize_data, synthesize_par
+from asda_tools.batch import find_input_files, output_filename, run_batch, split_output_conflicts
+from asda_tools.cache import TextconvCache
+from asda_tools.compact import CompactParFile
+from asda_tools.export import CSVTableWriter, export
+from asda_tools.lazy import LazyASDAReader
+from asda_tools import textconv_client
+from asda_tools.textconv_daemon import TextconvServer
+from asda_tools.numpy_backend import NumpyASDAParser
 
 
 class TestASDAParser(unittest.TestCase):
@@ -24,6 +50,315 @@ class TestASDAParser(unittest.TestCase):
                     ideal_json = f.read()
                 self.assertEqual(output_json, ideal_json)
 
+    def test_param_table(self):
+        table = ParamTable.from_keys(["P1-10", "P0-02", "P1-09", "P10-01"])
+        self.assertEqual(list(table), [(0, 2, "P0-02"), (1, 9, "P1-09"), (1, 10, "P1-10"), (10, 1, "P10-01")])
+
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        parser = ASDAParser()
+        parser.load_param_file(test_filename + ".par")
+        parser.parse()
+        table = parser.param_table
+        self.assertEqual(len(table), len(parser.data["params"]))
+        parser.reconstruct()
+        self.assertIs(parser.param_table, table)
+        del parser.data["params"]["P0-01"]
+        self.assertFalse(table.matches(parser.data["params"]))
+
+    def test_write_json(self):
+        for filename in self.DATA_FILES:
+            test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, filename)
+            with self.subTest(test_filename=test_filename):
+                parser = ASDAParser()
+                parser.load_param_file(test_filename + ".par")
+                parser.parse()
+                output = io.StringIO()
+                parser.write_json(output)
+                with open(test_filename + ".json") as f:
+                    self.assertEqual(output.getvalue(), f.read())
+
+    def test_load_sources(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0] + ".par")
+        with open(test_filename, "rb") as f:
+            ideal_binary = f.read()
+        with open(test_filename, "rb") as file_object:
+            for source in [ideal_binary, bytearray(ideal_binary), memoryview(ideal_binary), file_object]:
+                with self.subTest(source=type(source).__name__):
+                    parser = ASDAParser()
+                    parser.load_param_file(source)
+                    parser.parse()
+                    self.assertEqual(bytes(parser.binary), ideal_binary)
+
+        with open(test_filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with ASDAParser() as parser:
+                parser.load_param_file(mapped)
+                parser.parse()
+                self.assertEqual(bytes(parser.binary), ideal_binary)
+        self.assertIsNone(parser.binary)
+        self.assertIn("params", parser.data)
+
+    def test_export_csv(self):
+        filenames = [os.path.join(os.path.dirname(__file__), self.DATA_DIR, filename + ".par") for filename in self.DATA_FILES]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_filename = os.path.join(tmp_dir, "export.csv")
+            writer = CSVTableWriter(output_filename)
+            try:
+                failures = export(filenames + [os.path.join(tmp_dir, "missing.par")], writer, batch_rows=100, max_workers=2)
+            finally:
+                writer.close()
+            self.assertEqual(len(failures), 1)
+            with open(output_filename, newline="") as f:
+                rows = list(csv.DictReader(f))
+
+        for filename in filenames:
+            parser = ASDAParser()
+            parser.load_param_file(filename)
+            parser.parse()
+            file_rows = {row["param"]: row for row in rows if row["file"] == filename}
+            self.assertEqual(len(file_rows), len(parser.data["params"]))
+            row = file_rows["P1-44"]
+            self.assertEqual(int(row["current"]), parser.data["params"]["P1-44"]["current"])
+            self.assertEqual(int(row["max"]), parser.data["params"]["P1-44"]["max"])
+            self.assertEqual(int(row["firmware_version"]), parser.data["firmware_version"])
+
+    def test_lazy_reader(self):
+        for filename in self.DATA_FILES:
+            test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, filename)
+            with self.subTest(test_filename=test_filename):
+                parser = ASDAParser()
+                parser.load_param_file(test_filename + ".par")
+                parser.parse()
+                with LazyASDAReader(test_filename + ".par") as reader:
+                    for key, value in parser.data["params"].items():
+                        self.assertEqual(reader.param(key), value)
+                    self.assertEqual(reader.param((1, 44)), parser.data["params"]["P1-44"])
+                    with self.assertRaises(KeyError):
+                        reader.param("P9-99")
+                    for name in ["firmware_version", "firmware_subversion", "0002_unknown_x", "storage_mode", "asdasoft_version_string"]:
+                        self.assertEqual(reader.field(name), parser.data[name])
+                    reader.validate()
+
+    def test_set_params(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0] + ".par")
+        reference = load_parsed(test_filename)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "patched.par")
+            shutil.copyfile(test_filename, filename)
+            limits = reference["params"]["P1-44"]
+            new_value = limits["max"] if limits["current"] != limits["max"] else limits["min"]
+            self.assertEqual(set_params(filename, [("P1-44", new_value)]), [("P1-44", limits["current"], new_value)])
+            with self.assertRaises(ValueError):
+                set_params(filename, [("P1-45", reference["params"]["P1-45"]["current"]), ("P1-44", limits["max"] + 1)])
+            with self.assertRaises(KeyError):
+                set_params(filename, [("P9-99", 0)])
+
+            parser = ASDAParser()
+            parser.load_param_file(filename)
+            parser.parse()
+            parser.reconstruct()
+            parser.assert_reconstruction_correct()
+            reference["params"]["P1-44"]["current"] = new_value
+            self.assertEqual(parser.data, reference)
+
+            broken_filename = os.path.join(tmp_dir, "broken.par")
+            with open(broken_filename, "wb") as f:
+                f.write(b"not a .par file")
+            reader = LazyASDAReader()
+            with self.assertRaises(ASDAParseError):
+                reader.open(broken_filename)
+            self.assertIsNone(reader._mmap)
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                self.assertEqual(asdaparset_main([broken_filename, "P1-44=1"]), 1)
+                self.assertEqual(asdaparset_main([os.path.join(tmp_dir, "missing.par"), "P1-44=1"]), 1)
+            self.assertIn("missing.par", stderr.getvalue())
+
+    def test_main_options(self):
+        self.assertEqual(_split_main_args(["drive.par", "--stats"]), ({"--stats"}, ["drive.par"], None))
+        self.assertEqual(_split_main_args(["--cache", "--", "--stats"]), ({"--cache"}, ["--stats"], None))
+        self.assertEqual(_split_main_args(["--stats", "--batch", "-j", "2", "--x"]), ({"--stats"}, ["--batch", "-j", "2", "--x"], None))
+        self.assertEqual(_split_main_args(["drive.par", "--unknown"])[2], "Unknown option --unknown")
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as context:
+            asdapar2json_main(["drive.par", "--unknown"])
+        self.assertEqual(context.exception.code, 2)
+
+    def test_startup_imports(self):
+        # Startup time dominates textconv; the parser must not pull in json (and re) until it is needed
+        code = "import sys, asda_tools, asda_tools.lazy, asda_tools.cache; print(' '.join(sorted(sys.modules)))"
+        modules = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), "..")).decode().split()
+        for module in ["json", "re", "tempfile", "argparse", "numpy"]:
+            self.assertNotIn(module, modules)
+
+    @unittest.skipIf(sys.version_info < (3, 7), "asda_tools imports the parser eagerly before Python 3.7")
+    def test_textconv_client_imports(self):
+        code = "import sys, asda_tools.textconv_client; print(' '.join(sorted(sys.modules)))"
+        modules = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), "..")).decode().split()
+        self.assertNotIn("asda_tools.asdapar2json", modules)
+        self.assertIn("asda_tools.textconv_client", modules)
+        code = "from asda_tools import ASDAParser, asdapar2json; print(ASDAParser is asdapar2json.ASDAParser)"
+        self.assertEqual(subprocess.check_output([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), "..")), b"True\n")
+
+    def test_main_commands(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        cwd = os.path.join(os.path.dirname(__file__), "..")
+        with open(test_filename + ".json", "rb") as f:
+            self.assertEqual(subprocess.check_output([sys.executable, "-m", "asda_tools", "parse", test_filename + ".par"], cwd=cwd), f.read())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "built.par")
+            subprocess.check_call([sys.executable, "-m", "asda_tools", "build", test_filename + ".json", filename], cwd=cwd)
+            self.assertEqual(subprocess.call([sys.executable, "-m", "asda_tools", "diff", test_filename + ".par", filename], cwd=cwd), 0)
+        self.assertEqual(subprocess.call([sys.executable, "-m", "asda_tools"], cwd=cwd, stderr=subprocess.DEVNULL), 2)
+        for command in [["build"], ["build", test_filename + ".json"], ["parse"]]:
+            self.assertEqual(subprocess.call([sys.executable, "-m", "asda_tools"] + command, cwd=cwd, stderr=subprocess.DEVNULL), 2)
+
+    def test_compact(self):
+        for filename in self.DATA_FILES:
+            test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, filename)
+            with self.subTest(test_filename=test_filename):
+                parser = ASDAParser()
+                parser.load_param_file(test_filename + ".par")
+                parser.parse()
+                compact = CompactParFile.load(test_filename + ".par", verify=True)
+                self.assertEqual(len(compact), len(parser.data["params"]))
+                self.assertEqual(compact.param("P1-44"), parser.data["params"]["P1-44"])
+                self.assertEqual(compact.value((1, 44), "current"), parser.data["params"]["P1-44"]["current"])
+                with self.assertRaises(KeyError):
+                    compact.param("P9-99")
+                self.assertEqual(compact.to_data(), parser.data)
+                self.assertEqual(compact.to_json(), parser.to_json())
+                with open(test_filename + ".par", "rb") as f:
+                    self.assertEqual(compact.reconstruct(), f.read())
+
+    def test_async_parser(self):
+        class Chunks(object):
+            # Async iterable of bytes, like the body of an upload
+            def __init__(self, binary):
+                self.chunks = [binary[start : start + 1000] for start in range(0, len(binary), 1000)]
+
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                if not self.chunks:
+                    raise StopAsyncIteration
+                return self.chunks.pop(0)
+
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        with open(test_filename + ".par", "rb") as f:
+            binary = f.read()
+        with open(test_filename + ".json", "r") as f:
+            json_string = f.read()
+        parser = ASDAParser()
+        parser.load_param_file(binary)
+        parser.parse()
+
+        async def run(tmp_dir):
+            aio = AsyncASDAParser(max_workers=2)
+            stream = asyncio.StreamReader()
+            stream.feed_data(binary)
+            stream.feed_eof()
+            results = await asyncio.gather(
+                    aio.load_param_file(test_filename + ".par"),
+                    aio.load_param_file(stream),
+                    aio.load_param_file(Chunks(binary)),
+                    aio.from_json_file(test_filename + ".json"))
+            for data in results:
+                self.assertEqual(data, parser.data)
+            self.assertEqual(await aio.render_json(Chunks(binary)), json_string)
+
+            filename = os.path.join(tmp_dir, "restored.par")
+            await aio.write_reconstruction(results[-1], filename)
+            with open(filename, "rb") as f:
+                self.assertEqual(f.read(), binary)
+
+            aio.MAX_STREAM_SIZE = len(binary) - 1
+            with self.assertRaises(ASDAParseError):
+                await aio.load_param_file(Chunks(binary))
+
+        loop = asyncio.new_event_loop()
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                loop.run_until_complete(run(tmp_dir))
+        finally:
+            loop.close()
+
+    def test_diff(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0] + ".par")
+        reference = load_parsed(test_filename)
+        self.assertEqual(diff_data(reference, load_parsed(test_filename)), [])
+
+        changed = load_parsed(test_filename)
+        changed["firmware_version"] += 1
+        changed["params"]["P1-44"]["current"] += 1
+        del changed["params"]["P0-01"]
+        self.assertEqual(diff_data(reference, changed), [
+            ("firmware_version", None, reference["firmware_version"], reference["firmware_version"] + 1),
+            ("P0-01", None, reference["params"]["P0-01"], None),
+            ("P1-44", "current", reference["params"]["P1-44"]["current"], reference["params"]["P1-44"]["current"] + 1),
+            ])
+
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.assertEqual(asdapardiff_main([test_filename, test_filename]), 0)
+            self.assertEqual(asdapardiff_main([test_filename + ".missing", test_filename]), 2)
+        self.assertIn("FileNotFoundError", stderr.getvalue())
+
+    def test_synthetic_files(self):
+        rng = random.Random(0)
+        layouts = [([64, 99, 97, 14, 25, 100, 100, 28], [0x0001, 0x0002, 0x0018, 0x0006, 0x0007, 0x0008])]
+        layouts += [([rng.randrange(100) for block in range(8)], random_section_types(rng)) for layout in range(5)]
+        for block_lengths, section_types in layouts:
+            with self.subTest(block_lengths=block_lengths, section_types=section_types):
+                binary = synthesize_par(block_lengths, section_types)
+                parser = ASDAParser()
+                parser.load_param_file(binary)
+                parser.parse()
+                self.assertEqual(len(parser.data["params"]), sum(block_lengths))
+                self.assertEqual([section["section_type"] for section in parser.data["section_table"]], section_types)
+                parser.reconstruct()
+                parser.assert_reconstruction_correct()
+
+    def test_section_codecs(self):
+        writer = ASDAParser()
+        writer.data = synthesize_data()
+        writer.data["section_table"].append({"section_type": 0x0042, "opaque_content": "2a000000"})
+        writer.update_section_table()
+        writer.reconstruct()
+        binary = bytes(writer.binary_reconstruct)
+
+        parser = ASDAParser()
+        parser.load_param_file(binary)
+        with self.assertRaises(ASDAParseError):
+            parser.parse()
+
+        parser = ASDAParser(opaque_unknown_sections=True)
+        parser.load_param_file(binary)
+        parser.parse()
+        self.assertEqual(parser.data, writer.data)
+        parser.reconstruct()
+        parser.assert_reconstruction_correct()
+
+        class VariantParser(ASDAParser):
+            def _load_section_0042_answer(self, expected_end):
+                self.data["answer"] = self.binary[self.current_offset]
+                self.current_offset = expected_end
+
+            def _section_0042_answer_size(self):
+                return 4
+
+            def _reconstruct_section_0042_answer_into(self, buffer, offset):
+                buffer[offset] = self.data["answer"]
+
+        VariantParser.register_section(0x0042, SectionCodec("0042_answer"), firmware_version=writer.data["firmware_version"])
+        self.assertNotIn((0x0042, writer.data["firmware_version"]), ASDAParser.SECTION_CODECS)
+        parser = VariantParser()
+        records = []
+        parser.add_stats_hook(records.append)
+        parser.load_param_file(binary)
+        parser.parse()
+        self.assertEqual(parser.data["answer"], 42)
+        self.assertNotIn("records", [record for record in records if record["stage"] == "section_0x0042"][0])
+        parser.reconstruct()
+        parser.assert_reconstruction_correct()
+
     def test_reconstruct(self):
         for filename in self.DATA_FILES:
             test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, filename)
@@ -35,6 +370,283 @@ class TestASDAParser(unittest.TestCase):
                     ideal_binary = f.read()
                 self.assertEqual(writer.binary_reconstruct, ideal_binary)
 
+    def test_reconstruction_differences(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        parser = ASDAParser()
+        parser.load_param_file(test_filename + ".par")
+        parser.parse()
+        parser.data["params"]["P1-44"]["current"] += 1
+        parser.reconstruct()
+        with self.assertRaisesRegex(ASDAParseError, "at position 0x"):
+            parser.assert_reconstruction_correct()
+        differences = parser.reconstruction_differences()
+        self.assertEqual(len(differences), 1)
+        self.assertIn("parameter P1-44", differences[0][2])
+        with self.assertRaisesRegex(ASDAParseError, "section type 0x0018.*parameter P1-44"):
+            parser.assert_reconstruction_correct(diff_report=True)
+
+    def test_stats_hook(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        records = []
+        parser = ASDAParser()
+        parser.add_stats_hook(records.append)
+        parser.load_param_file(test_filename + ".par")
+        parser.parse()
+        parser.to_json()
+        parser.reconstruct()
+        parser.assert_reconstruction_correct()
+        stages = [record["stage"] for record in records]
+        self.assertEqual(stages, ["load", "magic", "section_table"] +
+                ["section_0x{:04X}".format(section["section_type"]) for section in parser.data["section_table"]] +
+                ["json_encode", "reconstruct", "verify"])
+        stats = {record["stage"]: record for record in records}
+        self.assertEqual(stats["section_0x0018"]["records"], len(parser.data["params"]))
+        self.assertEqual(stats["section_0x0006"]["records"], len(parser.data["params"]))
+        self.assertNotIn("records", stats["section_0x0001"])
+        self.assertEqual(stats["reconstruct"]["bytes"], len(parser.binary))
+        self.assertEqual(sum(record["bytes"] for record in records if record["stage"].startswith("section_0x")) +
+                stats["magic"]["bytes"] + stats["section_table"]["bytes"], len(parser.binary))
+
+    def test_textconv_daemon(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        with open(test_filename + ".par", "rb") as f:
+            binary = f.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            socket_path = os.path.join(tmp_dir, "textconv.sock")
+            server = TextconvServer(socket_path)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                status, payload = textconv_client.request(binary, socket_path)
+                self.assertEqual(status, textconv_client.STATUS_OK)
+                with open(test_filename + ".json", "rb") as f:
+                    self.assertEqual(payload, f.read())
+                status, payload = textconv_client.request(b"broken", socket_path)
+                self.assertEqual(status, textconv_client.STATUS_ERROR)
+                self.assertIn(b"ASDAParseError", payload)
+
+                writer = ASDAParser()
+                writer.data = synthesize_data()
+                writer.data["section_table"].append({"section_type": 0x0042, "opaque_content": "2a000000"})
+                writer.update_section_table()
+                writer.reconstruct()
+                unknown_binary = bytes(writer.binary_reconstruct)
+                status, payload = textconv_client.request(unknown_binary, socket_path)
+                self.assertEqual(status, textconv_client.STATUS_ERROR)
+                status, payload = textconv_client.request(unknown_binary, socket_path, opaque_unknown_sections=True)
+                self.assertEqual(status, textconv_client.STATUS_OK)
+                self.assertIn(b'"opaque_content": "2a000000"', payload)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            with self.assertRaises(OSError):
+                textconv_client.request(binary, socket_path)
+
+    def test_textconv_socket_checks(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            socket_path = os.path.join(tmp_dir, "textconv.sock")
+            server = TextconvServer(socket_path)
+            try:
+                # A live daemon keeps its socket
+                with self.assertRaises(OSError):
+                    TextconvServer(socket_path)
+                textconv_client.check_socket_path(socket_path)
+                os.chmod(tmp_dir, 0o777)
+                with self.assertRaises(PermissionError):
+                    textconv_client.check_socket_path(socket_path)
+                os.chmod(tmp_dir, 0o1777)
+                textconv_client.check_socket_path(socket_path)
+                os.chmod(tmp_dir, 0o700)
+            finally:
+                server.server_close()
+
+            # A socket left over by a crashed daemon is replaced
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+                stale.bind(socket_path)
+            TextconvServer(socket_path).server_close()
+
+            with open(socket_path, "w"):
+                pass
+            with self.assertRaises(PermissionError):
+                textconv_client.check_socket_path(socket_path)
+            with self.assertRaises(OSError):
+                TextconvServer(socket_path)
+            self.assertTrue(os.path.isfile(socket_path))
+
+    def test_write_reconstruction(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        writer = ASDAParser()
+        writer.from_json_file(test_filename + ".json")
+        writer.reconstruct()
+        with open(test_filename + ".par", "rb") as f:
+            ideal_binary = f.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_filename = os.path.join(tmp_dir, "output.par")
+            fd = os.open(output_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            try:
+                writer.write_reconstruction(fd)
+            finally:
+                os.close(fd)
+            with open(output_filename, "rb") as f:
+                self.assertEqual(f.read(), ideal_binary)
+            with open(output_filename, "wb") as f:
+                writer.write_reconstruction(f)
+            with open(output_filename, "rb") as f:
+                self.assertEqual(f.read(), ideal_binary)
+
+    def test_numpy_backend(self):
+        for filename in self.DATA_FILES:
+            test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, filename)
+            with self.subTest(test_filename=test_filename):
+                parser = NumpyASDAParser()
+                parser.load_param_file(test_filename + ".par")
+                parser.parse()
+                with open(test_filename + ".json") as f:
+                    self.assertEqual(parser.to_json() + "\n", f.read())
+                parser.reconstruct()
+                parser.assert_reconstruction_correct()
+
+    def test_batch(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_dir = os.path.join(tmp_dir, "input")
+            os.makedirs(os.path.join(input_dir, "sub"))
+            for filename in self.DATA_FILES:
+                shutil.copy(os.path.join(os.path.dirname(__file__), self.DATA_DIR, filename + ".par"), os.path.join(input_dir, "sub"))
+            with open(os.path.join(input_dir, "broken.par"), "wb") as f:
+                f.write(b"broken")
+
+            output_dir = os.path.join(tmp_dir, "output")
+            jobs = [(filename_in, output_filename(base_directory, filename_in, ".json", output_dir))
+                    for base_directory, filename_in in find_input_files([input_dir], ".par")]
+            self.assertEqual(len(jobs), len(self.DATA_FILES) + 1)
+            failures = run_batch(convert_par_to_json, jobs, 2)
+            self.assertEqual([filename_in for filename_in, error in failures], [os.path.join(input_dir, "broken.par")])
+            for filename in self.DATA_FILES:
+                with open(os.path.join(output_dir, "sub", filename + ".json")) as f, \
+                        open(os.path.join(os.path.dirname(__file__), self.DATA_DIR, filename + ".json")) as ideal:
+                    self.assertEqual(f.read(), ideal.read())
+
+    def test_batch_output_names(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for directory in ["fleet/drive1", "fleet/drive2", "other/drive1"]:
+                os.makedirs(os.path.join(tmp_dir, directory))
+                with open(os.path.join(tmp_dir, directory, "backup.par"), "wb") as f:
+                    f.write(b"")
+            output_dir = os.path.join(tmp_dir, "output")
+
+            def outputs(inputs):
+                return sorted(os.path.relpath(output_filename(base_directory, filename_in, ".json", output_dir), output_dir)
+                        for base_directory, filename_in in find_input_files([os.path.join(tmp_dir, name) for name in inputs], ".par"))
+
+            self.assertEqual(outputs(["fleet/*/backup.par"]), [os.path.join("drive1", "backup.json"), os.path.join("drive2", "backup.json")])
+            self.assertEqual(outputs(["fleet", "other"]), [os.path.join("fleet", "drive1", "backup.json"),
+                os.path.join("fleet", "drive2", "backup.json"), os.path.join("other", "drive1", "backup.json")])
+            self.assertEqual(outputs(["fleet/drive1/backup.par", "other/drive1/backup.par"]),
+                    [os.path.join("fleet", "drive1", "backup.json"), os.path.join("other", "drive1", "backup.json")])
+
+            fleet_file = os.path.join(tmp_dir, "fleet", "drive1", "backup.par")
+            other_file = os.path.join(tmp_dir, "other", "drive1", "backup.par")
+            same_output = os.path.join(output_dir, "backup.json")
+            jobs, failures = split_output_conflicts([(fleet_file, same_output), (other_file, same_output), (fleet_file, fleet_file + ".json")])
+            self.assertEqual(jobs, [(fleet_file, fleet_file + ".json")])
+            self.assertEqual([filename_in for filename_in, error in failures], [fleet_file, other_file])
+            jobs, failures = split_output_conflicts([(fleet_file, same_output), (fleet_file, same_output)])
+            self.assertEqual((jobs, failures), ([(fleet_file, same_output)], []))
+
+    def test_standalone_script(self):
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        with open(test_filename + ".json", "rb") as f:
+            ideal_json = f.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # A copied script must not pick up an unrelated "cache" module from sys.path
+            shutil.copy(os.path.join(os.path.dirname(__file__), "..", "asda_tools", "asdapar2json.py"), tmp_dir)
+            os.makedirs(os.path.join(tmp_dir, "cache"))
+            with open(os.path.join(tmp_dir, "cache", "__init__.py"), "w") as f:
+                f.write("raise RuntimeError('unrelated module')\n")
+            environment = dict(os.environ, ASDA_TOOLS_CACHE_DIR=os.path.join(tmp_dir, "cache_dir"))
+            process = subprocess.run([sys.executable, os.path.join(tmp_dir, "asdapar2json.py"), test_filename + ".par"],
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=environment, cwd=tmp_dir)
+            self.assertEqual(process.returncode, 0)
+            self.assertEqual(process.stdout, ideal_json)
+            self.assertIn(b"Warning: cache disabled", process.stderr)
+
+            shutil.copy(os.path.join(os.path.dirname(__file__), "..", "asda_tools", "cache.py"), tmp_dir)
+            process = subprocess.run([sys.executable, os.path.join(tmp_dir, "asdapar2json.py"), test_filename + ".par"],
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=environment, cwd=tmp_dir)
+            self.assertEqual((process.returncode, process.stdout, process.stderr), (0, ideal_json, b""))
+            self.assertTrue(os.path.isdir(os.path.join(tmp_dir, "cache_dir")))
+
+    def test_package_main(self):
+        # --cache and --batch load their modules through the package when installed
+        test_filename = os.path.join(os.path.dirname(__file__), self.DATA_DIR, self.DATA_FILES[0])
+        with open(test_filename + ".json") as f:
+            ideal_json = f.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, "cache_dir")
+            with unittest.mock.patch.dict(os.environ, ASDA_TOOLS_CACHE_DIR=cache_dir):
+                for cache_hit in [False, True]:
+                    with contextlib.redirect_stdout(io.StringIO()) as stdout, contextlib.redirect_stderr(io.StringIO()) as stderr:
+                        asdapar2json_main(["--cache", "--stats", test_filename + ".par"])
+                    self.assertEqual(stdout.getvalue(), ideal_json)
+                    self.assertEqual('"stage": "cache_hit"' in stderr.getvalue(), cache_hit)
+            self.assertTrue(os.listdir(cache_dir))
+
+            input_dir = os.path.join(tmp_dir, "input")
+            os.makedirs(input_dir)
+            shutil.copy(test_filename + ".par", input_dir)
+            with contextlib.redirect_stdout(io.StringIO()), self.assertRaises(SystemExit) as context:
+                asdapar2json_main(["--batch", "-j", "1", "-o", os.path.join(tmp_dir, "output"), input_dir])
+            self.assertEqual(context.exception.code, 0)
+            with open(os.path.join(tmp_dir, "output", self.DATA_FILES[0] + ".json")) as f:
+                self.assertEqual(f.read(), ideal_json)
+
+            for jobs in ["0", "-1", "x"]:
+                with contextlib.redirect_stderr(io.StringIO()) as stderr, self.assertRaises(SystemExit) as context:
+                    asdapar2json_main(["--batch", "-j", jobs, input_dir], prog="asdapar2json")
+                self.assertEqual(context.exception.code, 2)
+                self.assertIn("asdapar2json --batch: error: argument -j/--jobs", stderr.getvalue())
+
+    def test_textconv_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = TextconvCache(tmp_dir, max_size=25)
+            key_a = cache.key(b"a", ASDAParser.PARSER_VERSION)
+            key_b = cache.key(b"b", ASDAParser.PARSER_VERSION)
+            key_c = cache.key(b"a", ASDAParser.PARSER_VERSION + 1)
+            self.assertNotEqual(key_a, key_c)
+            self.assertIsNone(cache.get(key_a))
+
+            cache.put(key_a, "a" * 10)
+            os.utime(cache._path(key_a), (1, 1))
+            cache.put(key_b, "b" * 10)
+            os.utime(cache._path(key_b), (2, 2))
+            # A hit makes key_a the most recently used entry
+            self.assertEqual(cache.get(key_a), "a" * 10)
+            cache.put(key_c, "c" * 10)
+            self.assertEqual(cache.get(key_a), "a" * 10)
+            self.assertIsNone(cache.get(key_b))
+            self.assertEqual(cache.get(key_c), "c" * 10)
+
+            # Below the limit, put() only updates the size index instead of scanning the cache
+            cache = TextconvCache(os.path.join(tmp_dir, "indexed"), max_size=100)
+            cache.put(key_a, "a" * 10)
+            cache._entries = lambda: self.fail("cache directory scanned")
+            cache.put(key_b, "b" * 10)
+            self.assertEqual(cache._read_total_size(), 20)
+
+            # The cache is best-effort: an unusable directory only disables it
+            regular_file = os.path.join(tmp_dir, "regular_file")
+            with open(regular_file, "w"):
+                pass
+            for directory in [regular_file, os.path.join(regular_file, "sub")]:
+                cache = TextconvCache(directory)
+                with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                    self.assertIsNone(cache.get(key_a))
+                    cache.put(key_a, "a")
+                    self.assertIsNone(cache.get(key_a))
+                self.assertTrue(cache.disabled)
+                self.assertEqual(stderr.getvalue().count("Warning"), 1)
+
 
 if __name__ == '__main__':
     unittest.main()